@@ -0,0 +1,206 @@
+"""
+Corpus sintético y determinista para benchmarks (no necesita red ni datos reales).
+
+Genera, a partir de una semilla:
+  - imágenes sueltas (PNG/JPEG) de documentos escaneados
+  - PDFs "escaneados" de 1 a 30 páginas (páginas raster, sin capa de texto)
+  - PDFs nativos con capa de texto (escritos a mano, fuente Helvetica)
+  - páginas HTML
+con patentes, VINs, CUITs, fechas, vencimientos y emisores como los reales.
+La misma semilla produce los mismos bytes, así los reportes son comparables.
+
+Uso:
+    python -m bench.corpus --out data/bench/corpus
+"""
+import argparse, hashlib, io, json, pathlib, random, time
+from typing import Any, Dict, List
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+DEFAULT_OUT = ROOT / "data" / "bench" / "corpus"
+
+# perfil por defecto: cubre todos los tipos y el rango de páginas 1-30
+PROFILES = {
+    "quick": {"images": 2, "scanned_pages": [1, 3], "digital_pages": [1, 4], "html": 1},
+    "default": {"images": 4, "scanned_pages": [1, 2, 5, 10, 30], "digital_pages": [1, 3, 12], "html": 3},
+}
+
+EMISORES = ["Sancor Seguros", "Zurich Argentina", "Provincia Seguros", "Registro Automotor DNRPA",
+            "Ministerio de Transporte", "VTV Verificación Técnica"]
+TIPOS = ["PÓLIZA DE SEGURO AUTOMOTOR", "CÉDULA DE IDENTIFICACIÓN DEL VEHÍCULO",
+         "CERTIFICADO DE VERIFICACIÓN TÉCNICA", "TÍTULO DEL AUTOMOTOR"]
+NOMBRES = ["Juan Pérez", "María Gómez", "Carlos Fernández", "Lucía Martínez", "Diego Rodríguez"]
+_VIN_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"
+_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _cuit(rng: random.Random, valid: bool = True) -> str:
+    pre = rng.choice(["20", "23", "27", "30", "33"])
+    body = "".join(rng.choice("0123456789") for _ in range(8))
+    digits = [int(c) for c in pre + body]
+    mod = 11 - sum(d * w for d, w in zip(digits, [5, 4, 3, 2, 7, 6, 5, 4, 3, 2])) % 11
+    dv = 0 if mod == 11 else 9 if mod == 10 else mod
+    if not valid:
+        dv = (dv + 1) % 10
+    return f"{pre}-{body}-{dv}"
+
+def _plate(rng: random.Random) -> str:
+    if rng.random() < 0.6:
+        return (rng.choice(_LETTERS) + rng.choice(_LETTERS) + f"{rng.randrange(1000):03d}"
+                + rng.choice(_LETTERS) + rng.choice(_LETTERS))
+    return "".join(rng.choice(_LETTERS) for _ in range(3)) + f" {rng.randrange(1000):03d}"
+
+def _date(rng: random.Random, year_from: int = 2018, year_to: int = 2027) -> str:
+    return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(year_from, year_to)}"
+
+
+def document_lines(rng: random.Random, page: int, pages: int, plate: str, vin: str) -> List[str]:
+    """Texto de una página; la patente y el VIN se repiten en todas las páginas del documento."""
+    lines = [
+        rng.choice(TIPOS),
+        f"Entidad emisora: {rng.choice(EMISORES)}",
+        f"Titular: {rng.choice(NOMBRES)}   CUIT: {_cuit(rng, valid=rng.random() > 0.15)}",
+        f"Dominio / Patente: {plate}",
+        f"VIN / Chasis: {vin}",
+        f"Fecha de emisión: {_date(rng, 2018, 2024)}",
+        f"Vencimiento: {_date(rng, 2025, 2028)}",
+    ]
+    for _ in range(rng.randint(4, 10)):
+        words = rng.sample(["cobertura", "responsabilidad", "civil", "terceros", "vehículo", "modelo",
+                            "marca", "motor", "uso", "particular", "prima", "cuota", "cláusula",
+                            "franquicia", "asegurado", "domicilio", "localidad", "provincia"], 6)
+        lines.append(" ".join(words).capitalize() + ".")
+    lines.append(f"Página {page} de {pages}")
+    return lines
+
+def _doc_ids(rng: random.Random):
+    return _plate(rng), "".join(rng.choice(_VIN_CHARS) for _ in range(17))
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1: solo la fuente bitmap chica
+        return ImageFont.load_default()
+
+def render_scan(lines: List[str], rng: random.Random, size=(1240, 1754)) -> Image.Image:
+    """Página escaneada a ~150 dpi: texto, leve rotación, desenfoque y ruido."""
+    im = Image.new("L", size, 250)
+    draw = ImageDraw.Draw(im)
+    title, body = _font(40), _font(28)
+    y = 120
+    for i, line in enumerate(lines):
+        draw.text((100, y), line, fill=20, font=title if i == 0 else body)
+        y += 70 if i == 0 else 48
+    im = im.rotate(rng.uniform(-0.8, 0.8), resample=Image.BICUBIC, fillcolor=250)
+    if rng.random() < 0.5:
+        im = im.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 1.0)))
+    # ruido con la semilla del corpus (Image.effect_noise usa el rand() de C)
+    noise = np.random.default_rng(rng.randrange(2**32)).normal(0, rng.uniform(4, 12), (size[1], size[0]))
+    return Image.fromarray(np.clip(np.asarray(im, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+
+
+def _pdf_escape(s: str) -> bytes:
+    s = s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return s.encode("cp1252", errors="replace")
+
+def digital_pdf(pages: List[List[str]]) -> bytes:
+    """PDF nativo mínimo con capa de texto (Helvetica, WinAnsi), escrito a mano."""
+    objs: List[bytes] = []
+    n = len(pages)
+    # 1: catálogo, 2: páginas, 3: fuente, luego (página, contenido) por página
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n))
+    objs.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode())
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for i, lines in enumerate(pages):
+        ops = [b"BT /F1 16 Tf 72 780 Td 20 TL"]
+        ops += [b"(" + _pdf_escape(line) + b") '" for line in lines]
+        ops.append(b"ET")
+        stream = b"\n".join(ops)
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objs, start=1):
+        offsets.append(out.tell())
+        out.write(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode())
+    for off in offsets:
+        out.write(f"{off:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def scanned_pdf(images: List[Image.Image]) -> bytes:
+    buf = io.BytesIO()
+    # fechas fijas: si no Pillow pone la hora actual y el archivo cambia en cada corrida
+    fixed = time.strptime("2024-01-01", "%Y-%m-%d")
+    images[0].save(buf, format="PDF", save_all=True, append_images=images[1:], resolution=150,
+                   creationDate=fixed, modDate=fixed, producer="Scanner", title="scan")
+    return buf.getvalue()
+
+def html_page(lines: List[str], rng: random.Random) -> bytes:
+    noise = "".join(f"<script>var x{i}={rng.randrange(10**6)};</script>" for i in range(5))
+    body = "\n".join(f"<p>{line}</p>" for line in lines[1:])
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{lines[0]}</title>"
+            f"<style>p{{margin:2px}}</style>{noise}</head><body><h1>{lines[0]}</h1>\n{body}\n"
+            f"</body></html>").encode("utf-8")
+
+
+def build_corpus(out_dir: pathlib.Path = DEFAULT_OUT, seed: int = 0, profile: str = "default") -> Dict[str, Any]:
+    """Escribe el corpus en out_dir y devuelve el manifiesto (también en manifest.json)."""
+    prof = PROFILES[profile]
+    out_dir = pathlib.Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    docs = []
+
+    def _write(name: str, kind: str, pages: int, data: bytes):
+        (out_dir / name).write_bytes(data)
+        docs.append({"name": name, "kind": kind, "pages": pages, "bytes": len(data),
+                     "sha256": hashlib.sha256(data).hexdigest()})
+
+    for i in range(prof["images"]):
+        plate, vin = _doc_ids(rng)
+        im = render_scan(document_lines(rng, 1, 1, plate, vin), rng)
+        buf = io.BytesIO()
+        if i % 2 == 0:
+            im.save(buf, format="PNG")
+            _write(f"image_{i:02d}.png", "image", 1, buf.getvalue())
+        else:
+            im.save(buf, format="JPEG", quality=rng.choice([35, 60, 85]))
+            _write(f"image_{i:02d}.jpg", "image", 1, buf.getvalue())
+
+    for n in prof["scanned_pages"]:
+        plate, vin = _doc_ids(rng)
+        imgs = [render_scan(document_lines(rng, p, n, plate, vin), rng) for p in range(1, n + 1)]
+        _write(f"scanned_{n:02d}p.pdf", "scanned_pdf", n, scanned_pdf(imgs))
+
+    for n in prof["digital_pages"]:
+        plate, vin = _doc_ids(rng)
+        pages = [document_lines(rng, p, n, plate, vin) for p in range(1, n + 1)]
+        _write(f"digital_{n:02d}p.pdf", "digital_pdf", n, digital_pdf(pages))
+
+    for i in range(prof["html"]):
+        plate, vin = _doc_ids(rng)
+        _write(f"page_{i:02d}.html", "html", 1, html_page(document_lines(rng, 1, 1, plate, vin), rng))
+
+    manifest = {"seed": seed, "profile": profile, "documents": docs}
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    return manifest
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Genera el corpus sintético de benchmark")
+    ap.add_argument("--out", default=str(DEFAULT_OUT))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="default")
+    args = ap.parse_args()
+    m = build_corpus(pathlib.Path(args.out), seed=args.seed, profile=args.profile)
+    total = sum(d["bytes"] for d in m["documents"])
+    print(f"[CORPUS] {len(m['documents'])} documentos, {total/1e6:.1f} MB -> {args.out}")
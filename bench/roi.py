@@ -0,0 +1,164 @@
+"""
+OCR por regiones (ocr.mode: roi) contra página completa: velocidad y recall de campos.
+
+Por defecto genera páginas escaneadas con bench.corpus (mismo texto y ruido) y
+les agrega lo que el OCR por regiones se saltea: una foto del vehículo, un sello
+y algunas páginas en blanco. Como el texto es conocido, el recall se mide contra
+la verdad: patentes, VINs, CUITs y fechas (los patrones de pipeline/features.py)
+que aparecen en el OCR de cada modo. Con --input se usan documentos reales
+(imágenes o PDFs) y el recall de roi se mide contra lo que encuentra la página
+completa.
+
+Las dos pasadas usan el mismo engine (mismos threads); se corre una pasada de
+calentamiento antes de medir.
+
+Uso:
+    python -m bench.roi --pages 12
+    python -m bench.roi --input /ruta/documentos --language spa --out data/bench/roi.json
+"""
+import argparse, json, os, pathlib, random, sys, time
+from typing import Any, Dict, List, Set
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from bench.corpus import _doc_ids, _font, document_lines, render_scan
+from pipeline.features import scan_page
+from pipeline.ocr import ocr_images
+
+FIELDS = ["plate", "vin", "cuit", "date"]
+
+
+def fields(text: str) -> Set[tuple]:
+    """(tipo, valor normalizado) de los campos que buscan las features."""
+    return {(m["kind"], "".join(m["value"].split())) for m in scan_page(text, 1) if m["kind"] in FIELDS}
+
+
+def _photo(rng: random.Random, size) -> Image.Image:
+    """Foto en escala de grises: manchas suaves, bordes nítidos (carrocería, ruedas) y textura."""
+    g = np.random.default_rng(rng.randrange(2**32))
+    im = Image.fromarray(g.integers(30, 220, (8, 8), dtype=np.uint8)).resize(size, Image.BICUBIC)
+    d = ImageDraw.Draw(im)
+    w, h = size
+    d.rounded_rectangle((w * 0.1, h * 0.35, w * 0.9, h * 0.75), radius=40, fill=rng.randint(40, 200))
+    for cx in (w * 0.28, w * 0.72):
+        d.ellipse((cx - h * 0.13, h * 0.62, cx + h * 0.13, h * 0.88), fill=25, outline=200, width=8)
+    for _ in range(12):
+        d.line([(rng.uniform(0, w), rng.uniform(0, h)) for _ in range(2)], fill=rng.randint(0, 255), width=rng.randint(1, 4))
+    tex = g.normal(0, 18, (h, w))
+    return Image.fromarray(np.clip(np.asarray(im, dtype=np.float32) + tex, 0, 255).astype(np.uint8))
+
+def _stamp(rng: random.Random, im: Image.Image, xy):
+    d = ImageDraw.Draw(im)
+    x, y, r = xy[0], xy[1], 110
+    d.ellipse((x - r, y - r, x + r, y + r), outline=60, width=6)
+    d.ellipse((x - r + 18, y - r + 18, x + r - 18, y + r - 18), outline=60, width=3)
+    d.text((x - 70, y - 18), rng.choice(["PAGADO", "ORIGINAL", "RECIBIDO"]), fill=60, font=_font(34))
+
+def synthetic_pages(n: int, seed: int = 0, blank_every: int = 6, dpi: int = 150) -> List[Dict[str, Any]]:
+    """
+    Páginas con foto y sello; una de cada `blank_every` en blanco. Se dibujan a
+    150 dpi (bench.corpus) y con dpi=300 se reescalan, como un PDF rasterizado.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n):
+        if blank_every and i % blank_every == blank_every - 1:
+            g = np.random.default_rng(i).normal(248, 4, (1754 * dpi // 150, 1240 * dpi // 150))
+            pages.append({"page": i + 1, "image": np.clip(g, 0, 255).astype(np.uint8), "dpi": dpi, "truth": set()})
+            continue
+        plate, vin = _doc_ids(rng)
+        lines = document_lines(rng, 1, 1, plate, vin)
+        im = render_scan(lines, rng)
+        # la foto va debajo del texto (el texto ocupa hasta ~y=1000) y el sello al costado
+        photo = _photo(rng, (rng.randint(500, 800), rng.randint(400, 550)))
+        im.paste(photo, (rng.randint(80, 1240 - photo.width - 60), 1100))
+        _stamp(rng, im, (rng.randint(950, 1100), rng.randint(250, 700)))
+        if rng.random() < 0.5:
+            im = im.filter(ImageFilter.GaussianBlur(0.4))
+        if dpi != 150:
+            im = im.resize((im.width * dpi // 150, im.height * dpi // 150), Image.BICUBIC)
+        pages.append({"page": i + 1, "image": np.asarray(im), "dpi": dpi, "truth": fields("\n".join(lines))})
+    return pages
+
+def input_pages(path: pathlib.Path, dpi: int) -> List[Dict[str, Any]]:
+    from pipeline.ingest import iter_pdf_pages, load_image_page
+    pages = []
+    files = sorted(p for p in path.iterdir() if p.suffix.lower() in (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".webp"))
+    for f in files:
+        if f.suffix.lower() == ".pdf":
+            pages.extend(iter_pdf_pages(str(f), dpi=dpi))
+        else:
+            pages.append(load_image_page(str(f)))
+    for i, p in enumerate(pages, start=1):
+        p["page"] = i
+    return pages
+
+
+def run_mode(pages, language: str, workers: int, roi) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    res = ocr_images(pages, lang=language, workers=workers, roi=roi)
+    return {"wall_ms": round((time.perf_counter() - t0) * 1000, 1), "texts": res["texts"],
+            "per_page": res["stats"]["per_page"]}
+
+def _recall(found: List[Set[tuple]], truth: List[Set[tuple]]) -> Dict[str, Any]:
+    out = {}
+    for kind in FIELDS + [None]:
+        t = sum(len({f for f in tr if kind is None or f[0] == kind}) for tr in truth)
+        hit = sum(len({f for f in tr & fo if kind is None or f[0] == kind}) for tr, fo in zip(truth, found))
+        out[kind or "all"] = round(hit / t, 4) if t else None
+    return out
+
+def compare(pages, language: str, workers: int, roi: Dict[str, Any]) -> Dict[str, Any]:
+    # calentamiento: carga del traineddata y primeros threads
+    run_mode(pages[:1], language, workers, None)
+    full = run_mode(pages, language, workers, None)
+    rois = run_mode(pages, language, workers, roi)
+    f_full = [fields(t) for t in full["texts"]]
+    f_roi = [fields(t) for t in rois["texts"]]
+    truth = [p.get("truth") for p in pages]
+    report: Dict[str, Any] = {
+        "pages": len(pages), "workers": workers, "roi": roi,
+        "full_ms": full["wall_ms"], "roi_ms": rois["wall_ms"],
+        "speedup": round(full["wall_ms"] / rois["wall_ms"], 2) if rois["wall_ms"] else None,
+        "regions_per_page": round(float(np.mean([p.get("regions", 0) for p in rois["per_page"]])), 1),
+        # lo que encuentra roi de lo que encuentra la página completa
+        "recall_vs_full": _recall(f_roi, f_full),
+        "missed_vs_full": sorted({f"{k}:{v}" for fu, ro in zip(f_full, f_roi) for k, v in fu - ro})[:20],
+    }
+    if all(t is not None for t in truth):
+        report["recall_truth"] = {"full": _recall(f_full, truth), "roi": _recall(f_roi, truth)}
+    return report
+
+def print_report(r: Dict[str, Any]):
+    print(f"[ROI] {r['pages']} páginas, {r['workers']} threads: página completa {r['full_ms']:.0f} ms, "
+          f"roi {r['roi_ms']:.0f} ms (x{r['speedup']}), {r['regions_per_page']} regiones/página")
+    if "recall_truth" in r:
+        for mode in ("full", "roi"):
+            rec = r["recall_truth"][mode]
+            print(f"  recall {mode:<4} " + "  ".join(f"{k}={v}" for k, v in rec.items()))
+    print("  roi vs full  " + "  ".join(f"{k}={v}" for k, v in r["recall_vs_full"].items()))
+    if r["missed_vs_full"]:
+        print(f"  no encontrados por roi: {', '.join(r['missed_vs_full'])}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="OCR por regiones vs página completa")
+    ap.add_argument("--input", default=None, help="carpeta con imágenes/PDFs reales (si no, páginas sintéticas)")
+    ap.add_argument("--pages", type=int, default=12, help="páginas sintéticas")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--dpi", type=int, default=300, help="DPI de las páginas (PDFs de --input o sintéticas)")
+    ap.add_argument("--language", default="spa")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--roi", default="{}", help='kwargs de pipeline.roi.text_regions en JSON, p.ej. \'{"pad_y_in": 0.08}\'')
+    ap.add_argument("--out", default=None, help="JSON con el reporte")
+    args = ap.parse_args()
+
+    pages = input_pages(pathlib.Path(args.input), args.dpi) if args.input else synthetic_pages(args.pages, args.seed, dpi=args.dpi)
+    report = compare(pages, args.language, args.workers, json.loads(args.roi))
+    print_report(report)
+    if args.out:
+        pathlib.Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(args.out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
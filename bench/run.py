@@ -0,0 +1,253 @@
+"""
+Benchmark del pipeline sobre el corpus sintético (bench/corpus.py).
+
+Mide cada etapa de pipeline/ por separado (capa de texto, rasterizado, OCR,
+señales de imagen, texto, metadatos, predict) y analyze_document_ml completo,
+y escribe un reporte JSON. Dos reportes se comparan con --compare para ver si
+una optimización ayuda o si hay regresiones antes de desplegar.
+
+Uso:
+    python -m bench.run --out data/bench/report.json
+    python -m bench.run --out nuevo.json --compare data/bench/report.json --fail-on-regression
+"""
+import argparse, json, multiprocessing, os, pathlib, platform, statistics, subprocess, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import yaml
+from bench.corpus import DEFAULT_OUT, build_corpus
+from models import infer_ml
+from models.infer_ml import analyze_document_ml, configure, score_rows, _build_feature_row
+from pipeline.ingest import iter_pdf_pages, load_image_page, html_to_text, pdf_text_layer, text_layer_usable
+from pipeline.ocr import ocr_images
+from pipeline.metadata import read_metadata_exiftool
+from pipeline.features import image_page_stats, summarize_images, summarize_text, reasons_from_text, reasons_from_image_stats
+
+# diferencias por debajo de esto son ruido de medición, no regresiones
+MIN_DELTA_MS = 5.0
+
+
+def _timed(fn: Callable, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - t0) * 1000
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def stage_times(path: str, kind: str, language: str, cfg: Dict[str, Any]) -> Dict[str, float]:
+    """Una pasada por las etapas del pipeline, aisladas y en el orden de extract_document_features."""
+    ocfg, mcfg = cfg.get("ocr", {}), cfg.get("metadata", {})
+    dpi = int(ocfg.get("pdf_render_dpi", 300))
+    t: Dict[str, float] = {}
+    pages: List[dict] = []
+    texts: List[str] = []
+
+    if kind == "html":
+        text, t["html"] = _timed(html_to_text, path)
+        texts = [text]
+    elif kind == "image":
+        page, t["decode"] = _timed(load_image_page, path)
+        pages = [page]
+    else:
+        layer, t["text_layer"] = _timed(pdf_text_layer, path)
+        min_chars = int(ocfg.get("text_layer_min_chars", 40))
+        texts = list(layer)
+        missing = [i for i, s in enumerate(layer, start=1) if not text_layer_usable(s, min_chars)] if layer else None
+        t0 = time.perf_counter()
+        if missing is None:
+            pages = list(iter_pdf_pages(path, dpi=dpi))
+        else:
+            for p in missing:
+                pages.extend(iter_pdf_pages(path, dpi=dpi, first=p, last=p))
+        t["render"] = (time.perf_counter() - t0) * 1000
+
+    if pages:
+        image_stats, t["image_stats"] = _timed(lambda: [image_page_stats(p) for p in pages])
+        ocr, t["ocr"] = _timed(ocr_images, pages, lang=language, workers=infer_ml._ocr_workers())
+        if texts:
+            for st, s in zip(ocr["stats"]["per_page"], ocr["texts"]):
+                texts[st["page"] - 1] = s
+        else:
+            texts = ocr["texts"]
+    else:
+        image_stats = []
+
+    _, t["text_features"] = _timed(lambda: reasons_from_text(texts, summarize_text(texts)))
+    _, t["image_features"] = _timed(lambda: (summarize_images(image_stats), reasons_from_image_stats(image_stats)))
+    meta, t["metadata"] = _timed(read_metadata_exiftool, path, timeout_s=float(mcfg.get("timeout_s", 10)),
+                                 processes=int(mcfg.get("exiftool_processes", 1)))
+    row = _build_feature_row(meta, texts, image_stats)[0]
+    _, t["predict"] = _timed(score_rows, [row])
+    return t
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {"median_ms": round(statistics.median(samples), 2), "min_ms": round(min(samples), 2)}
+
+def run_benchmark(corpus_dir: pathlib.Path, cfg: Dict[str, Any], language: str, repeat: int,
+                  concurrency: int = 0) -> Dict[str, Any]:
+    manifest = json.loads((corpus_dir / "manifest.json").read_text(encoding="utf-8"))
+    configure(cfg)
+
+    # calentamiento: carga del modelo, Tesseract y exiftool fuera de la medición
+    seen = set()
+    for d in manifest["documents"]:
+        if d["kind"] not in seen:
+            seen.add(d["kind"])
+            analyze_document_ml(str(corpus_dir / d["name"]), language)
+
+    docs = []
+    for d in manifest["documents"]:
+        path = str(corpus_dir / d["name"])
+        stages: Dict[str, List[float]] = {}
+        e2e, score, timings = [], None, None
+        for _ in range(repeat):
+            for k, v in stage_times(path, d["kind"], language, cfg).items():
+                stages.setdefault(k, []).append(v)
+            result, ms = _timed(analyze_document_ml, path, language)
+            e2e.append(ms)
+            score, timings = result["risk_score"], result["debug"].get("timings")
+        docs.append({**{k: d[k] for k in ("name", "kind", "pages", "bytes")},
+                     "stages": {k: _summary(v) for k, v in stages.items()},
+                     "e2e": _summary(e2e), "risk_score": score, "timings": timings})
+        print(f"  {d['name']:<22} {d['pages']:>3}p  e2e {docs[-1]['e2e']['median_ms']:>9.1f} ms")
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_commit": _git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "language": language, "repeat": repeat,
+            "corpus": {"seed": manifest["seed"], "profile": manifest["profile"],
+                       "documents": len(manifest["documents"])},
+        },
+        "documents": docs,
+        "summary": _aggregate(docs),
+    }
+    if concurrency > 0:
+        report["throughput"] = run_throughput(corpus_dir, manifest, cfg, language, concurrency)
+    return report
+
+def _aggregate(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    stages: Dict[str, float] = {}
+    by_kind: Dict[str, Dict[str, float]] = {}
+    for d in docs:
+        for k, v in d["stages"].items():
+            stages[k] = stages.get(k, 0.0) + v["median_ms"]
+        agg = by_kind.setdefault(d["kind"], {"documents": 0, "pages": 0, "e2e_ms": 0.0})
+        agg["documents"] += 1
+        agg["pages"] += d["pages"]
+        agg["e2e_ms"] += d["e2e"]["median_ms"]
+    for agg in by_kind.values():
+        agg["e2e_ms"] = round(agg["e2e_ms"], 2)
+        agg["ms_per_page"] = round(agg["e2e_ms"] / max(1, agg["pages"]), 2)
+    e2e = sum(d["e2e"]["median_ms"] for d in docs)
+    pages = sum(d["pages"] for d in docs)
+    return {"stages_ms": {k: round(v, 2) for k, v in sorted(stages.items())}, "by_kind": by_kind,
+            "e2e_ms": round(e2e, 2), "pages": pages,
+            "pages_per_s": round(pages / (e2e / 1000), 3) if e2e else None}
+
+def run_throughput(corpus_dir: pathlib.Path, manifest: Dict[str, Any], cfg: Dict[str, Any],
+                   language: str, concurrency: int) -> Dict[str, Any]:
+    """Todo el corpus por un pool de procesos, como el servicio: documentos y páginas por segundo."""
+    paths = [str(corpus_dir / d["name"]) for d in manifest["documents"]]
+    # spawn: este proceso ya tiene threads de OCR/exiftool y un fork podría heredar locks tomados
+    with ProcessPoolExecutor(max_workers=concurrency, initializer=configure, initargs=(cfg,),
+                             mp_context=multiprocessing.get_context("spawn")) as ex:
+        # calentamiento de cada worker
+        list(ex.map(analyze_document_ml, paths[:concurrency], [language] * min(concurrency, len(paths))))
+        t0 = time.perf_counter()
+        list(ex.map(analyze_document_ml, paths, [language] * len(paths)))
+        wall = time.perf_counter() - t0
+    pages = sum(d["pages"] for d in manifest["documents"])
+    return {"concurrency": concurrency, "wall_s": round(wall, 3),
+            "docs_per_s": round(len(paths) / wall, 3), "pages_per_s": round(pages / wall, 3)}
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.10) -> Dict[str, Any]:
+    """Cambios por documento y etapa (ratio nuevo/viejo); regresión = más lento que threshold y que MIN_DELTA_MS."""
+    old_docs = {d["name"]: d for d in old["documents"]}
+    rows, regressions, score_changes = [], [], []
+    for d in new["documents"]:
+        o = old_docs.get(d["name"])
+        if o is None:
+            continue
+        pairs = [("e2e", o["e2e"], d["e2e"])] + [
+            (k, o["stages"][k], v) for k, v in d["stages"].items() if k in o["stages"]]
+        for stage, ov, nv in pairs:
+            a, b = ov["median_ms"], nv["median_ms"]
+            row = {"document": d["name"], "stage": stage, "old_ms": a, "new_ms": b,
+                   "ratio": round(b / a, 3) if a else None}
+            rows.append(row)
+            if a and b > a * (1 + threshold) and b - a > MIN_DELTA_MS:
+                regressions.append(row)
+        if o.get("risk_score") != d.get("risk_score"):
+            score_changes.append({"document": d["name"], "old": o.get("risk_score"), "new": d.get("risk_score")})
+    oe, ne = old["summary"]["e2e_ms"], new["summary"]["e2e_ms"]
+    return {
+        "old_commit": old["meta"].get("git_commit"), "new_commit": new["meta"].get("git_commit"),
+        "e2e_ms": {"old": oe, "new": ne, "ratio": round(ne / oe, 3) if oe else None},
+        "stages_ms": {k: {"old": old["summary"]["stages_ms"].get(k), "new": v}
+                      for k, v in new["summary"]["stages_ms"].items()},
+        "regressions": regressions, "score_changes": score_changes, "rows": rows,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark de etapas y end-to-end del pipeline")
+    ap.add_argument("--corpus", default=str(DEFAULT_OUT), help="carpeta del corpus; se genera si no existe")
+    ap.add_argument("--profile", default="default", help="perfil de bench/corpus.py al generarlo")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--config", default=os.environ.get("APP_CONFIG", str(ROOT / "configs" / "app.yaml")))
+    ap.add_argument("--language", default=None, help="por defecto ocr.default_lang")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--concurrency", type=int, default=0, help="procesos para medir throughput (0 = no medir)")
+    ap.add_argument("--out", default=str(ROOT / "data" / "bench" / "report.json"))
+    ap.add_argument("--compare", default=None, help="reporte anterior para comparar")
+    ap.add_argument("--threshold", type=float, default=0.10)
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    corpus_dir = pathlib.Path(args.corpus)
+    if not (corpus_dir / "manifest.json").exists():
+        build_corpus(corpus_dir, seed=args.seed, profile=args.profile)
+    language = args.language or cfg.get("ocr", {}).get("default_lang", "spa")
+
+    print(f"[BENCH] corpus={corpus_dir} repeat={args.repeat} language={language}")
+    report = run_benchmark(corpus_dir, cfg, language, max(1, args.repeat), args.concurrency)
+
+    out = pathlib.Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    s = report["summary"]
+    print(f"[BENCH] e2e total {s['e2e_ms']:.1f} ms, {s['pages_per_s']} páginas/s")
+    for k, v in s["stages_ms"].items():
+        print(f"  {k:<15} {v:>10.1f} ms")
+    if "throughput" in report:
+        print(f"[BENCH] throughput: {report['throughput']}")
+
+    regressions = []
+    if args.compare:
+        old = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8"))
+        cmp = compare(old, report, args.threshold)
+        report["compare"] = {k: v for k, v in cmp.items() if k != "rows"}
+        regressions = cmp["regressions"]
+        print(f"[COMPARE] {cmp['old_commit']} -> {cmp['new_commit']}: e2e x{cmp['e2e_ms']['ratio']}")
+        for r in regressions:
+            print(f"  REGRESIÓN {r['document']} {r['stage']}: {r['old_ms']} -> {r['new_ms']} ms")
+        for c in cmp["score_changes"]:
+            print(f"  SCORE {c['document']}: {c['old']} -> {c['new']}")
+
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"[BENCH] reporte -> {out}")
+    if args.fail_on_regression and regressions:
+        raise SystemExit(1)
@@ -0,0 +1,144 @@
+"""
+Reporte de arranque: tiempo de import de service.main y memoria por worker del
+pool de análisis según el modo de arranque (fork, spawn, forkserver, con y sin
+el modelo precargado por service.preload).
+
+RSS cuenta también las páginas compartidas; PSS las reparte entre los procesos
+que las comparten y USS son solo las privadas. Lo que los workers comparten
+copy-on-write se ve como PSS/USS bajos aunque el RSS sea parecido. Cada modo
+corre en un proceso aparte: el forkserver es uno por proceso y su preload no se
+puede cambiar una vez levantado.
+
+Uso:
+    python -m bench.startup --workers 4
+    python -m bench.startup --workers 4 --language eng --out data/bench/startup.json
+"""
+import argparse, asyncio, copy, json, os, pathlib, re, statistics, subprocess, sys, time
+from typing import Any, Dict, List, Optional
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import yaml
+
+MODES = ["spawn", "fork", "fork+preload", "forkserver", "forkserver+preload"]
+IMPORT_MODULES = ["service.main", "service.routes", "models.infer_ml", "fastapi", "numpy"]
+HEAVY = ["numpy", "PIL", "cv2", "sklearn", "joblib", "tesserocr", "pytesseract", "requests", "pypdf"]
+
+
+def _env(config: str) -> Dict[str, str]:
+    return {**os.environ, "APP_CONFIG": config,
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))}
+
+def import_times(config: str, repeat: int = 3) -> Dict[str, Any]:
+    """ms acumulados de import (python -X importtime) de service.main en un intérprete limpio."""
+    code = ("import sys, time; t = time.perf_counter(); import service.main; "
+            f"print(round((time.perf_counter() - t) * 1000, 1)); print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    runs: List[Dict[str, float]] = []
+    loaded = ""
+    for _ in range(repeat):
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=_env(config),
+                           capture_output=True, text=True, timeout=120)
+        if p.returncode != 0:
+            raise SystemExit(f"No se pudo importar service.main:\n{p.stderr[-2000:]}")
+        cum = {}
+        for line in p.stderr.splitlines():
+            m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)", line)
+            if m and m.group(2) in IMPORT_MODULES:
+                cum[m.group(2)] = int(m.group(1)) / 1000.0
+        out = p.stdout.split("\n")
+        cum["wall"] = float(out[0])
+        loaded = out[1]
+        runs.append(cum)
+    return {"ms": {k: round(statistics.median(r.get(k, 0.0) for r in runs), 1) for k in ["wall"] + IMPORT_MODULES},
+            "heavy_modules_loaded": [m for m in loaded.split(",") if m]}
+
+
+def _mem(pid: int) -> Optional[Dict[str, int]]:
+    """kB de RSS, PSS y USS (privadas) de /proc/<pid>/smaps_rollup; None fuera de Linux."""
+    try:
+        text = pathlib.Path(f"/proc/{pid}/smaps_rollup").read_text()
+    except OSError:
+        return None
+    vals = {k: int(v) for k, v in re.findall(r"^(\w+):\s+(\d+) kB", text, re.M)}
+    return {"rss_kb": vals.get("Rss", 0), "pss_kb": vals.get("Pss", 0),
+            "uss_kb": vals.get("Private_Clean", 0) + vals.get("Private_Dirty", 0)}
+
+async def _measure(cfg: Dict[str, Any], mode: str, workers: int) -> Dict[str, Any]:
+    from service.workers import pool_from_config
+    method, _, preload = mode.partition("+")
+    cfg = copy.deepcopy(cfg)
+    cfg.setdefault("workers", {}).update(processes=workers, start_method=method,
+                                         preload_model=bool(preload), warmup=True)
+    t0 = time.perf_counter()
+    pool = pool_from_config(cfg)
+    pool.start()
+    try:
+        pids = await pool.prime()
+        ready_s = time.perf_counter() - t0
+        procs = [m for m in (_mem(pid) for pid in pids) if m]
+        server = None
+        if method == "forkserver":
+            from multiprocessing import forkserver
+            spid = getattr(forkserver._forkserver, "_forkserver_pid", None)
+            server = _mem(spid) if spid else None
+    finally:
+        pool.shutdown()
+    out: Dict[str, Any] = {"mode": mode, "workers": len(pids), "ready_s": round(ready_s, 2)}
+    if procs:
+        for k in ("rss_kb", "pss_kb", "uss_kb"):
+            out[f"{k[:-3]}_per_worker_mb"] = round(statistics.mean(p[k] for p in procs) / 1024, 1)
+        # el forkserver también ocupa memoria: entra en el total
+        out["pss_total_mb"] = round((sum(p["pss_kb"] for p in procs) + (server or {}).get("pss_kb", 0)) / 1024, 1)
+    return out
+
+def measure_mode(config: str, mode: str, workers: int, language: Optional[str]) -> Dict[str, Any]:
+    """Corre _measure en un proceso nuevo (ver docstring del módulo)."""
+    cmd = [sys.executable, "-m", "bench.startup", "--config", config, "--workers", str(workers), "--_mode", mode]
+    if language:
+        cmd += ["--language", language]
+    p = subprocess.run(cmd, cwd=ROOT, env=_env(config), capture_output=True, text=True, timeout=600)
+    if p.returncode != 0:
+        return {"mode": mode, "error": p.stderr.strip().splitlines()[-1] if p.stderr.strip() else "falló"}
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+
+def print_report(report: Dict[str, Any]):
+    imp = report["import"]
+    print(f"[IMPORT] service.main {imp['ms']['wall']:.0f} ms  "
+          + "  ".join(f"{k}={imp['ms'][k]:.0f}" for k in IMPORT_MODULES[1:])
+          + f"  | cargados: {', '.join(imp['heavy_modules_loaded']) or '-'}")
+    print(f"{'modo':<20} {'listo(s)':>8} {'RSS/w MB':>9} {'PSS/w MB':>9} {'USS/w MB':>9} {'PSS total':>10}")
+    for r in report["modes"]:
+        if "error" in r:
+            print(f"{r['mode']:<20} error: {r['error']}")
+            continue
+        print(f"{r['mode']:<20} {r['ready_s']:>8.2f} {r.get('rss_per_worker_mb', 0):>9.1f} "
+              f"{r.get('pss_per_worker_mb', 0):>9.1f} {r.get('uss_per_worker_mb', 0):>9.1f} {r.get('pss_total_mb', 0):>10.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Tiempo de import y memoria por worker según el modo de arranque")
+    ap.add_argument("--config", default=os.environ.get("APP_CONFIG", str(ROOT / "configs" / "app.yaml")))
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--language", default=None, help="idioma del warmup de OCR (por defecto ocr.default_lang)")
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--out", default=None, help="JSON con el reporte")
+    ap.add_argument("--_mode", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    if args.language:
+        cfg.setdefault("ocr", {})["default_lang"] = args.language
+
+    if args._mode:
+        print(json.dumps(asyncio.run(_measure(cfg, args._mode, args.workers))))
+        sys.exit(0)
+
+    report = {"workers": args.workers, "import": import_times(args.config),
+              "modes": [measure_mode(args.config, m, args.workers, args.language) for m in args.modes.split(",")]}
+    print_report(report)
+    if args.out:
+        pathlib.Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
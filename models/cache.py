@@ -0,0 +1,154 @@
+import hashlib, json, os, pathlib, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(sha256: str, language: str, versions: Dict[str, Any]) -> str:
+    """Clave de contenido: mismo archivo + idioma + modelo + spec => mismo resultado."""
+    raw = "|".join([
+        sha256, language or "",
+        str(versions.get("model_version")), str(versions.get("feature_spec_version")),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache de resultados de analyze_document_ml en dos niveles: LRU en memoria del
+    proceso y, opcionalmente, un directorio en disco compartido entre procesos.
+    Ambos niveles expiran por TTL contado desde que se calculó el resultado (no
+    desde el último uso) y se acotan por tamaño. Los resultados se guardan
+    serializados en JSON, así cada get devuelve una copia independiente.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_s: float = 3600,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.disk_dir = pathlib.Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._prune_disk()
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Devuelve (resultado, nivel) con nivel "memory"/"disk", o (None, None)."""
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                expires_at, payload = item
+                if expires_at > now:
+                    self._mem.move_to_end(key)
+                    return json.loads(payload), "memory"
+                del self._mem[key]
+
+        hit = self._disk_get(key, now)
+        if hit is not None:
+            payload, expires_at = hit
+            # en memoria vence cuando vencería en disco, no un TTL entero después
+            self._mem_put(key, payload, expires_at)
+            return json.loads(payload), "disk"
+        return None, None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        payload = json.dumps(result, ensure_ascii=False)
+        self._mem_put(key, payload, time.time() + self.ttl_s)
+        self._disk_put(key, payload)
+
+    def _mem_put(self, key: str, payload: str, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._mem[key] = (expires_at, payload)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _disk_path(self, key: str) -> pathlib.Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        """(payload, vencimiento) o None. El mtime es la fecha de escritura y no se toca."""
+        if self.disk_dir is None:
+            return None
+        p = self._disk_path(key)
+        try:
+            st = p.stat()
+            if st.st_mtime + self.ttl_s <= now:
+                p.unlink(missing_ok=True)
+                return None
+            payload = p.read_text(encoding="utf-8")
+            # el atime hace de "último uso" para el desalojo LRU en disco (explícito:
+            # con noatime/relatime la lectura no lo actualiza)
+            os.utime(p, ns=(int(now * 1e9), st.st_mtime_ns))
+            return payload, st.st_mtime + self.ttl_s
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, payload: str):
+        if self.disk_dir is None:
+            return
+        p = self._disk_path(key)
+        try:
+            p.parent.mkdir(exist_ok=True)
+            data = payload.encode("utf-8")
+            tmp = p.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Borra vencidos y, si sigue excedido, los menos usados hasta quedar en 90% del tope."""
+        now = time.time()
+        entries, total = [], 0
+        for p in self.disk_dir.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if st.st_mtime + self.ttl_s <= now:
+                p.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_atime, st.st_size, p))
+            total += st.st_size
+        if total > self.disk_max_bytes:
+            entries.sort()
+            target = int(self.disk_max_bytes * 0.9)
+            for _, size, p in entries:
+                if total <= target:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+
+def cache_from_config(cfg: dict) -> Optional[ResultCache]:
+    """ResultCache según la sección `cache`; None si está deshabilitado."""
+    ccfg = cfg.get("cache", {})
+    if not ccfg.get("enabled", False):
+        return None
+    return ResultCache(
+        max_entries=ccfg.get("memory_entries", 512),
+        ttl_s=ccfg.get("ttl_s", 3600),
+        disk_dir=ccfg.get("disk_dir") or None,
+        disk_max_bytes=ccfg.get("disk_max_bytes", 512 * 1024 * 1024),
+    )
@@ -0,0 +1,129 @@
+"""
+Evaluador compilado de bosques de árboles (RandomForest/ExtraTrees de sklearn).
+
+compile_forest() aplana todos los árboles en arrays contiguos de NumPy
+(feature, threshold, children, value) y CompiledForest los recorre para todas
+las filas y todos los árboles a la vez, sin sklearn en el camino de inferencia.
+
+Uso:
+    python -m models.forest                      # compila models/rf_model.pkl
+    python -m models.forest --check data/dataset_autenticarIA200.csv
+"""
+import argparse, json, pathlib
+import numpy as np
+from typing import Any, Dict
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+MODELS = ROOT / "models"
+BUNDLE = MODELS / "rf_model.forest"
+
+_ARRAYS = ["feature", "threshold", "children", "value", "roots"]
+
+
+def compile_forest(model) -> Dict[str, Any]:
+    """
+    Aplana model.estimators_ en arrays globales. Los hijos van intercalados
+    (children[2*i] = izquierdo, children[2*i+1] = derecho) y las hojas apuntan a
+    sí mismas, así recorrer max_depth niveles deja cada fila en su hoja.
+    """
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for est in model.estimators_:
+        t = est.tree_
+        n = t.node_count
+        idx = np.arange(n)
+        is_leaf = t.children_left < 0
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(np.where(is_leaf, 0.0, t.threshold))
+        left.append(np.where(is_leaf, idx, t.children_left) + offset)
+        right.append(np.where(is_leaf, idx, t.children_right) + offset)
+        value.append(t.value[:, 0, 0])
+        max_depth = max(max_depth, int(t.max_depth))
+        offset += n
+    children = np.empty(2 * offset, dtype=np.int64)
+    children[0::2] = np.concatenate(left)
+    children[1::2] = np.concatenate(right)
+    return {
+        "feature": np.concatenate(feature).astype(np.int64),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "children": children,
+        "value": np.concatenate(value).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int64),
+        "max_depth": max_depth,
+        "n_features": int(model.n_features_in_),
+    }
+
+
+class CompiledForest:
+    def __init__(self, arrays: Dict[str, Any]):
+        for k in _ARRAYS:
+            setattr(self, k, arrays[k])
+        self.max_depth = int(arrays["max_depth"])
+        self.n_features = int(arrays["n_features"])
+
+    def predict(self, X) -> np.ndarray:
+        # sklearn compara en float32 contra umbrales float64: se replica para paridad exacta
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n = X.shape[0]
+        flat = X.ravel()
+        row_base = (np.arange(n, dtype=np.int64) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (n, self.roots.size))
+        for _ in range(self.max_depth):
+            # un gather por nivel para feature, umbral e hijo
+            go_right = ~(flat[row_base + self.feature[nodes]] <= self.threshold[nodes])
+            nodes = self.children[2 * nodes + go_right]
+        return self.value[nodes].mean(axis=1)
+
+
+def save_forest(arrays: Dict[str, Any], path: pathlib.Path = BUNDLE):
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for k in _ARRAYS:
+        np.save(path / f"{k}.npy", arrays[k])
+    meta = {"max_depth": arrays["max_depth"], "n_features": arrays["n_features"],
+            "n_trees": int(arrays["roots"].size), "n_nodes": int(arrays["feature"].size)}
+    (path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+
+def load_forest(path: pathlib.Path = BUNDLE, mmap: bool = False) -> CompiledForest:
+    """Con mmap=True los arrays quedan mapeados (solo lectura) y los procesos comparten el page cache."""
+    path = pathlib.Path(path)
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    arrays = {k: np.load(path / f"{k}.npy", mmap_mode="r" if mmap else None) for k in _ARRAYS}
+    arrays.update(max_depth=meta["max_depth"], n_features=meta["n_features"])
+    return CompiledForest(arrays)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compila rf_model.pkl a arrays de NumPy")
+    ap.add_argument("--model", default=str(MODELS / "rf_model.pkl"))
+    ap.add_argument("--out", default=str(BUNDLE))
+    ap.add_argument("--check", default=None,
+        help="CSV de entrenamiento para verificar paridad contra model.predict")
+    args = ap.parse_args()
+
+    import joblib
+    model = joblib.load(args.model)
+    arrays = compile_forest(model)
+    save_forest(arrays, pathlib.Path(args.out))
+    print(f"Compilado: {arrays['roots'].size} árboles, {arrays['feature'].size} nodos, "
+          f"profundidad máx {arrays['max_depth']} -> {args.out}")
+
+    if args.check:
+        import pandas as pd
+        spec = json.loads((MODELS / "feature_spec.json").read_text(encoding="utf-8"))
+        df = pd.read_csv(args.check)
+        X = df[spec["features"]].copy().fillna(0)
+        for c in X.columns:
+            if X[c].dtype == bool:
+                X[c] = X[c].astype(int)
+        X = X.to_numpy(dtype=np.float64)
+        ref = model.predict(X)
+        got = load_forest(pathlib.Path(args.out)).predict(X)
+        diff = float(np.max(np.abs(ref - got))) if len(ref) else 0.0
+        print(f"[PARIDAD] filas={len(ref)} max|diff|={diff:.3e}")
+        if diff > 1e-9:
+            raise SystemExit("El bosque compilado no coincide con model.predict")
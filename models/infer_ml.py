@@ -1,43 +1,286 @@
-import json, pathlib
-import joblib
+import os, pathlib, time
 import numpy as np
-from typing import Dict, Any
-from pipeline.ingest import sniff_ext, pdf_to_images, html_to_text
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, List
+from pipeline.ingest import sniff_ext, iter_pdf_pages, load_image_page, pdf_text_layer, pdf_page_count, text_layer_usable
+from pipeline.html_text import extract_html
 from pipeline.ocr import ocr_images
 from pipeline.metadata import read_metadata_exiftool
-from pipeline.features import summarize_text, reasons_from_metadata, reasons_from_text, reasons_from_images
+from pipeline.features import summarize_text, reasons_from_metadata, reasons_from_text, image_page_stats, reasons_from_image_stats, summarize_images
+
+from models import loader
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 MODELS = ROOT / "models"
 
-_model = joblib.load(MODELS / "rf_model.pkl")
-_spec  = json.loads((MODELS / "feature_spec.json").read_text(encoding="utf-8"))
-_FEATURES = _spec["features"]
+# Config de la app (configs/app.yaml). El servicio la inyecta en cada worker del
+# pool vía configure(); usado como librería/CLI quedan los defaults.
+_CFG: Dict[str, Any] = {}
+
+# campos de page_budget.required_fields -> flag de summarize_text
+_FIELD_FLAGS = {"date": "has_date", "patente": "has_patente", "vencimiento": "has_vencimiento",
+                "emisor": "has_entidad_emisora", "cuit": "has_cuit", "vin": "has_vin"}
+
+def configure(cfg: Dict[str, Any]):
+    global _page_cache
+    _CFG.clear()
+    _CFG.update(cfg or {})
+    _page_cache = None
+    loader.configure(_CFG.get("models", {}))
+
+def _ocr_workers() -> int:
+    """Threads de OCR por proceso: repartimos los cores entre los procesos de análisis."""
+    n = int(_CFG.get("ocr", {}).get("workers") or 0)
+    if n > 0:
+        return n
+    cpus = os.cpu_count() or 1
+    procs = int(_CFG.get("workers", {}).get("processes") or 0) or cpus
+    return max(1, cpus // procs)
+
+def warmup(language: str = None):
+    """
+    Prepara el proceso antes del primer pedido: modelo cargado con un predict
+    de prueba y motor OCR creado (una página en blanco por thread). Un error
+    acá (p.ej. falta el traineddata) no tumba el worker: lo verá el pedido real.
+    """
+    lang = language or _CFG.get("ocr", {}).get("default_lang", "spa")
+    try:
+        score_rows([{}])
+    except Exception as e:
+        print(f"[WARMUP] modelo: {type(e).__name__}: {e}")
+    try:
+        from pipeline.ocr import get_engine
+        workers = _ocr_workers()
+        get_engine(lang, workers).ocr_pages([np.full((32, 128), 255, dtype=np.uint8)] * workers)
+    except Exception as e:
+        print(f"[WARMUP] OCR ({lang}): {type(e).__name__}: {e}")
+
+class StageTimer:
+    """
+    Acumula milisegundos por etapa. Rasterizado y OCR corren solapados: "render"
+    es el tiempo esperando páginas de pdftoppm y "ocr" el resto del OCR.
+    """
+
+    def __init__(self):
+        self.ms: Dict[str, float] = {}
+        self._t0 = time.perf_counter()
+
+    def add(self, stage: str, ms: float):
+        self.ms[stage] = self.ms.get(stage, 0.0) + ms
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000)
+
+    def iterate(self, name: str, it: Iterable) -> Iterable:
+        """Envuelve un iterador sumando a `name` el tiempo de producir cada elemento."""
+        it = iter(it)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, (time.perf_counter() - t0) * 1000)
+                return
+            self.add(name, (time.perf_counter() - t0) * 1000)
+            yield item
+
+    def report(self) -> Dict[str, float]:
+        out = {k: round(v, 1) for k, v in self.ms.items()}
+        out["total"] = round((time.perf_counter() - self._t0) * 1000, 1)
+        return out
+
+_page_cache = None
+
+def _get_page_cache():
+    """Cache de OCR por página (ocr_cache en app.yaml); None si está apagada."""
+    global _page_cache
+    if _page_cache is None and _CFG.get("ocr_cache", {}).get("enabled", False):
+        from pipeline.page_cache import cache_from_config
+        _page_cache = cache_from_config(_CFG)
+    return _page_cache
+
+def _ocr_timed(pages, language: str, on_page, timer: StageTimer) -> Dict[str, Any]:
+    render_before = timer.ms.get("render", 0.0)
+    t0 = time.perf_counter()
+    if not isinstance(pages, list):
+        pages = timer.iterate("render", pages)
+    ocfg = _CFG.get("ocr", {})
+    roi = dict(ocfg.get("roi") or {}) if ocfg.get("mode", "full") == "roi" else None
+    ocr = ocr_images(pages, lang=language, workers=_ocr_workers(), on_page=on_page, cache=_get_page_cache(), roi=roi)
+    wall = (time.perf_counter() - t0) * 1000
+    timer.add("ocr", max(0.0, wall - (timer.ms.get("render", 0.0) - render_before)))
+    return ocr
+
+def _contiguous_runs(nums: List[int]) -> List[tuple]:
+    runs = []
+    for n in nums:
+        if runs and runs[-1][1] == n - 1:
+            runs[-1] = (runs[-1][0], n)
+        else:
+            runs.append((n, n))
+    return runs
+
+def _render(local_path: str, pages, dpi: int):
+    """Páginas del PDF rasterizadas a `dpi`: todas (pages=None) o solo las indicadas."""
+    if pages is None:
+        yield from iter_pdf_pages(local_path, dpi=dpi)
+        return
+    for first, last in _contiguous_runs(pages):
+        yield from iter_pdf_pages(local_path, dpi=dpi, first=first, last=last)
+
+def _needs_rerender(text: str, st: Dict[str, Any], ocfg: Dict[str, Any]) -> bool:
+    """Página OCReada a baja resolución que conviene repetir: poco texto o baja confianza."""
+    if len("".join(text.split())) < int(ocfg.get("adaptive_min_chars", 80)):
+        return True
+    conf = st.get("conf")
+    return conf is not None and conf < float(ocfg.get("adaptive_min_conf", 70))
+
+def _ocr_pass(local_path: str, pages, language: str, on_page, timer: StageTimer, dpi: int):
+    """
+    OCR de `pages` (None = todas). Con ocr.adaptive_dpi va primero a
+    adaptive_low_dpi y re-rasteriza a `dpi` las páginas con poco texto o baja
+    confianza. Devuelve ({página: (texto, stats)}, info del motor, re-rasterizadas).
+    """
+    ocfg = _CFG.get("ocr", {})
+    low = min(dpi, int(ocfg.get("adaptive_low_dpi", 150))) if ocfg.get("adaptive_dpi", False) else dpi
+    ocr = _ocr_timed(_render(local_path, pages, low), language, on_page, timer)
+    results = {st["page"]: (text, {**st, "source": "ocr", "dpi": low})
+               for st, text in zip(ocr["stats"]["per_page"], ocr["texts"])}
+    retry = []
+    if low < dpi:
+        retry = [n for n, (text, st) in results.items() if _needs_rerender(text, st, ocfg)]
+        if retry:
+            again = _ocr_timed(_render(local_path, retry, dpi), language, on_page, timer)
+            for st, text in zip(again["stats"]["per_page"], again["texts"]):
+                results[st["page"]] = (text, {**st, "source": "ocr", "dpi": dpi, "rerendered": True})
+    info = {"engine": ocr["stats"]["engine"], "workers": ocr["stats"]["workers"], "mode": ocr["stats"]["mode"]}
+    if low < dpi:
+        info["adaptive_dpi"] = {"low": low, "high": dpi}
+    return results, info, retry
+
+def _page_order(pages: List[int]) -> List[int]:
+    """Orden progresivo: primera, última y segunda página, y después una muestra cada vez más fina."""
+    if len(pages) <= 3:
+        return list(pages)
+    head, rest = [pages[0], pages[-1], pages[1]], pages[2:-1]
+    order, seen, k = [], set(), 1
+    # mitades sucesivas del resto (1/2, 1/4, 3/4, 1/8, ...) hasta cubrir todas las páginas
+    while len(order) < len(rest) and 2 ** k <= 4 * len(rest):
+        for j in range(1, 2 ** k, 2):
+            i = (j * len(rest)) // 2 ** k
+            if i not in seen:
+                seen.add(i)
+                order.append(rest[i])
+        k += 1
+    return head + order + [p for i, p in enumerate(rest) if i not in seen]
+
+def _pdf_texts(local_path: str, language: str, on_page, timer: StageTimer, dpi: int = 300,
+               should_stop=None) -> Dict[str, Any]:
+    """
+    Texto por página de un PDF. Primero intenta la capa de texto embebida (PDFs
+    nativos) y solo rasteriza + OCRea las páginas sin texto o con texto inverosímil.
+
+    Si hay más páginas para OCRear que page_budget.max_pages, se OCRean por tandas
+    en orden progresivo (_page_order) hasta el tope, y después de cada tanda
+    `should_stop(page_numbers, texts, total_pages)` puede cortar antes. Devuelve
+    solo las páginas analizadas (texts + page_numbers) y el total en stats.
+    """
+    t0 = time.time()
+    ocfg = _CFG.get("ocr", {})
+    bcfg = _CFG.get("page_budget", {})
+    layer = []
+    if ocfg.get("text_layer", True):
+        with timer.stage("text_layer"):
+            layer = pdf_text_layer(local_path)
+    total = len(layer) or pdf_page_count(local_path)
+
+    min_chars = int(ocfg.get("text_layer_min_chars", 40))
+    # solo las páginas con capa de texto usable; las demás entran si se OCRean
+    texts = {i: t for i, t in enumerate(layer, start=1) if text_layer_usable(t, min_chars)}
+    per_page = {i: {"page": i, "chars": len(t), "time_ms": 0, "source": "text_layer"} for i, t in texts.items()}
+    if layer:
+        missing = [i for i in range(1, len(layer) + 1) if i not in texts]
+    else:
+        # sin capa de texto se OCRea todo; None si ni siquiera se pudo contar las páginas
+        missing = list(range(1, total + 1)) if total else None
 
-def _build_feature_row(meta: dict, texts: list, images: list) -> Dict[str, Any]:
-    text_summary = summarize_text(texts)
+    def _merge(results):
+        for n, (text, st) in results.items():
+            texts[n] = text
+            per_page[n] = st
+
+    stats: Dict[str, Any] = {}
+    budget = int(bcfg.get("max_pages") or 0)
+    if missing is None or missing:
+        if budget and missing is not None and len(missing) > budget:
+            order = _page_order(missing)[:budget]
+            step = max(1, int(bcfg.get("batch_pages", 4)))
+            stopped, rerendered = "budget", []
+            for k in range(0, len(order), step):
+                results, info, retry = _ocr_pass(local_path, sorted(order[k:k + step]), language, on_page, timer, dpi)
+                _merge(results)
+                rerendered += retry
+                if should_stop is not None and k + step < len(order):
+                    done = sorted(texts)
+                    with timer.stage("early_exit"):
+                        if should_stop(done, [texts[n] for n in done], total):
+                            stopped = "fields_found"
+                            break
+            stats["page_budget"] = {"max_pages": budget, "ocr_candidates": len(missing), "stopped": stopped}
+        else:
+            results, info, rerendered = _ocr_pass(local_path, missing, language, on_page, timer, dpi)
+            _merge(results)
+        stats.update(info)
+        if "adaptive_dpi" in stats:
+            stats["adaptive_dpi"]["rerendered_pages"] = sorted(rerendered)
+
+    analyzed = sorted(texts)
+    ocr_pages = sum(1 for n in analyzed if per_page[n]["source"] == "ocr")
+    stats.update({
+        "pages": total or len(analyzed), "pages_analyzed": analyzed,
+        "total_chars": int(sum(len(texts[n]) for n in analyzed)),
+        "time_ms": int((time.time()-t0)*1000), "text_layer_pages": len(analyzed) - ocr_pages,
+        "per_page": [per_page[n] for n in analyzed],
+    })
+    return {"texts": [texts[n] for n in analyzed], "page_numbers": analyzed, "stats": stats}
+
+def _build_feature_row(meta: dict, texts: list, image_stats: list, dpi_used: int = 300,
+                       page_numbers: List[int] = None, total_pages: int = None,
+                       sections: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    text_summary = summarize_text(texts, page_numbers, sections)
+    image_summary = summarize_images(image_stats)
     r_meta = reasons_from_metadata(meta)
     r_text = reasons_from_text(texts, text_summary)
-    r_img  = reasons_from_images(images)
+    r_img  = reasons_from_image_stats(image_stats)
+
+    analyzed = text_summary.get("pages", len(texts) or len(image_stats))
+    num_pages = max(int(total_pages or 0), analyzed)
+    # con presupuesto de páginas los totales se extrapolan desde la muestra analizada
+    scale = num_pages / analyzed if analyzed else 1.0
 
     features: Dict[str, Any] = {
-        "num_pages": text_summary.get("pages", len(texts) or len(images)),
+        "num_pages": num_pages,
         "file_size_bytes": int(meta.get("FileSize") or 0),
         "has_metadata": int(bool(meta)),
         "producer_suspicious": int(any(k == "META_PRODUCER_SUSPICIOUS" for k,_,_ in r_meta)),
-        "ocr_total_chars": int(text_summary.get("total_chars", 0)),
-        "ocr_pages_with_text": int(text_summary.get("pages_with_text", 0)),
+        "ocr_total_chars": int(round(text_summary.get("total_chars", 0) * scale)),
+        "ocr_pages_with_text": int(round(text_summary.get("pages_with_text", 0) * scale)),
         "ocr_chars_per_page_mean": float(text_summary.get("chars_per_page_mean", 0.0)),
         "has_date": int(text_summary.get("has_date", False)),
-        "has_patente": int(text_summary.get("has_plate", False)),
+        "has_patente": int(text_summary.get("has_patente", False)),
         "has_vin": int(text_summary.get("has_vin", False)),
         "has_cuit": int(text_summary.get("has_cuit", False)),
-        "has_vencimiento": int(text_summary.get("has_vigencia", False)),
-        "has_entidad_emisora": int(text_summary.get("has_emisor", False)),
+        "has_vencimiento": int(text_summary.get("has_vencimiento", False)),
+        "has_entidad_emisora": int(text_summary.get("has_entidad_emisora", False)),
         "same_patente_all_pages": int(text_summary.get("same_plate_all_pages", False)),
-        "min_resolution_px": int(text_summary.get("min_resolution_px", 0)),
-        "low_res_flag": int(text_summary.get("low_res_flag", False)),
-        "dpi_used": int(text_summary.get("dpi_used", 300)),
+        "min_resolution_px": int(image_summary.get("min_resolution_px", 0)),
+        "low_res_flag": int(image_summary.get("low_res_flag", False)),
+        "dpi_used": int(dpi_used),
         "rule_IMAGE_LOW_RES": int(any(k=="IMAGE_LOW_RES" for k,_,_ in r_img)),
         "rule_META_PRODUCER_UNKNOWN": int(any(k=="META_PRODUCER_UNKNOWN" for k,_,_ in r_meta)),
         "rule_META_PRODUCER_MISSING": int(any(k=="META_PRODUCER_MISSING" for k,_,_ in r_meta)),
@@ -53,39 +296,99 @@ def _build_feature_row(meta: dict, texts: list, images: list) -> Dict[str, Any]:
         "reasons_count": int(len(r_meta)+len(r_text)+len(r_img)),
     }
 
-    row = {c: 0 for c in _FEATURES}
-    row.update({k: features.get(k, 0) for k in _FEATURES})
-    return row, (r_meta + r_text + r_img), text_summary
+    # todas las features calculadas: score_rows toma las de la spec del modelo activo
+    return features, (r_meta + r_text + r_img), text_summary, image_summary
 
-def analyze_document_ml(local_path: str, language: str = "spa") -> Dict[str, Any]:
+def extract_document_features(local_path: str, language: str = "spa", include_text: bool = False) -> Dict[str, Any]:
+    """
+    Etapas de extracción (rasterizado, OCR, metadatos, reglas) sin el scoring.
+    Devuelve un dict serializable para poder correrlo en otro proceso y
+    puntuar varias filas juntas con score_rows(). El texto por página solo se
+    incluye en debug si se pide (include_text), porque puede ser muy grande.
+    """
     ext = sniff_ext(local_path)
     is_pdf = ext == ".pdf"
     is_html = ext in (".html", ".htm")
 
-    per_page_images = []
-    temp_dir = None
-    if is_pdf:
-        temp_dir = str(pathlib.Path(local_path).with_suffix("")) + "_pages"
-        pathlib.Path(temp_dir).mkdir(exist_ok=True, parents=True)
-        per_page_images = pdf_to_images(local_path, temp_dir, dpi=300)
-    elif is_html:
-        per_page_images = []
-    else:
-        per_page_images = [local_path]
+    # Las páginas se decodifican una sola vez: las señales de imagen se calculan
+    # al llegar cada página y el array se libera cuando termina su OCR.
+    timer = StageTimer()
+    nominal_dpi = int(_CFG.get("ocr", {}).get("pdf_render_dpi", 300))
+    # por número de página: si una página se re-rasteriza, valen las señales del último render
+    page_stats: Dict[Any, Dict[str, Any]] = {}
+    def _on_page(page):
+        # corre dentro del OCR: su tiempo también está contado en "ocr"
+        with timer.stage("image_stats"):
+            page_stats[page.get("page")] = image_page_stats(page)
+
+    mcfg = _CFG.get("metadata", {})
+    with timer.stage("metadata"):
+        meta = read_metadata_exiftool(local_path, timeout_s=float(mcfg.get("timeout_s", 10)),
+                                      processes=int(mcfg.get("exiftool_processes", 1)))
 
-    ocr = {"texts": [], "stats": {"pages": 0, "total_chars": 0, "time_ms": 0}}
+    def _dpi_used() -> int:
+        # DPI real de las páginas rasterizadas (o el declarado por la imagen); sin imágenes, el nominal
+        dpis = [st["dpi"] for st in page_stats.values() if st.get("dpi")]
+        return min(dpis) if dpis else nominal_dpi
+
+    bcfg = _CFG.get("page_budget", {})
+    required = [_FIELD_FLAGS[f] for f in bcfg.get("required_fields", ["date", "patente", "vencimiento", "emisor", "cuit"])]
+    eps = float(bcfg.get("score_epsilon", 0.02))
+    last_score = []
+    def _should_stop(page_numbers, texts, total_pages) -> bool:
+        """Corte temprano: están todos los campos requeridos y el score no cambió con la última tanda."""
+        summary = summarize_text(texts, page_numbers)
+        if not all(summary.get(flag) for flag in required):
+            return False
+        row = _build_feature_row(meta, texts, list(page_stats.values()), _dpi_used(), page_numbers, total_pages)[0]
+        y = score_rows([row])[0]
+        stable = bool(last_score) and abs(y - last_score[-1]) <= eps
+        last_score.append(y)
+        return stable
+
+    page_numbers, total_pages, sections = None, None, None
     if is_html:
-        text = html_to_text(local_path)
-        ocr["texts"] = [text]
-        ocr["stats"] = {"pages": 1, "total_chars": len(text), "time_ms": 0}
+        with timer.stage("html"):
+            html = extract_html(local_path, _CFG.get("html", {}).get("max_chars", 500000))
+        sections = html["sections"]
+        ocr = {"texts": [html["text"]], "stats": {"pages": 1, "total_chars": len(html["text"]), "time_ms": 0,
+                                                  "truncated": html["truncated"]}}
+    elif is_pdf:
+        ocr = _pdf_texts(local_path, language, _on_page, timer, dpi=nominal_dpi, should_stop=_should_stop)
+        page_numbers, total_pages = ocr["page_numbers"], ocr["stats"]["pages"]
     else:
-        ocr = ocr_images(per_page_images, lang=language)
+        with timer.stage("decode"):
+            page = load_image_page(local_path)
+        ocr = _ocr_timed([page], language, _on_page, timer)
+
+    with timer.stage("features"):
+        row, reasons_all, text_summary, image_summary = _build_feature_row(
+            meta, ocr["texts"], list(page_stats.values()), _dpi_used(), page_numbers, total_pages, sections)
+    return {
+        "row": row,
+        "reasons": reasons_all,
+        "debug": {
+            "ocr_stats": ocr["stats"],
+            "pages_analyzed": page_numbers or list(range(1, len(ocr["texts"]) + 1)),
+            "metadata_summary": {k: meta.get(k) for k in ["Producer","Creator","ModifyDate","CreateDate"]},
+            "text_summary": text_summary,
+            "image_summary": image_summary,
+            "timings": timer.report(),
+            **({"texts": ocr["texts"]} if include_text else {}),
+        },
+    }
 
-    meta = read_metadata_exiftool(local_path)
+def score_rows(rows: List[Dict[str, Any]], bundle: "loader.ModelBundle" = None) -> List[float]:
+    """Puntúa varias filas de features con una sola llamada a predict (features ausentes = 0)."""
+    if not rows:
+        return []
+    bundle = bundle or loader.get_bundle()
+    X = np.array([[row.get(c, 0) for c in bundle.features] for row in rows], dtype=np.float64)
+    return [float(y) for y in bundle.model.predict(X)]
 
-    row, reasons_all, text_summary = _build_feature_row(meta, ocr["texts"], per_page_images)
-    X = np.array([[row[c] for c in _FEATURES]])
-    y01 = float(_model.predict(X)[0])
+def build_result(extracted: Dict[str, Any], y01: float, bundle: "loader.ModelBundle" = None) -> Dict[str, Any]:
+    bundle = bundle or loader.get_bundle()
+    extracted["debug"]["model_version"] = bundle.version
     y_score_1_100 = max(0.0, min(100.0, y01 * 100.0))
 
     label = "LOW" if y01 < 0.34 else "MEDIUM" if y01 < 0.67 else "HIGH"
@@ -93,12 +396,24 @@ def analyze_document_ml(local_path: str, language: str = "spa") -> Dict[str, Any
     return {
         "risk_score": round(y_score_1_100, 2),
         "risk_label": label,
-        "features_used": _FEATURES,
-        "debug": {
-            "ocr_stats": ocr["stats"],
-            "metadata_summary": {k: meta.get(k) for k in ["Producer","Creator","ModifyDate","CreateDate"]},
-            "text_summary": text_summary,
-        },
-        "reasons": [{"code": k, "msg": m, "w": w} for k,m,w in reasons_all],
+        "features_used": bundle.features,
+        "debug": extracted["debug"],
+        "reasons": [{"code": k, "msg": m, "w": w} for k,m,w in extracted["reasons"]],
         "validadoIA": True
     }
+
+def analyze_document_ml(local_path: str, language: str = "spa", include_text: bool = False) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    extracted = extract_document_features(local_path, language, include_text)
+    timings = extracted["debug"]["timings"]
+    # un solo bundle para puntuar y armar el resultado, aunque se publique otro en el medio
+    t1 = time.time()
+    bundle = loader.get_bundle()
+    if bundle.loaded_at >= t1:
+        # se cargó (o recambió) recién: no cuenta como predict
+        timings["model_load"] = bundle.load_ms
+    t1 = time.perf_counter()
+    y01 = score_rows([extracted["row"]], bundle)[0]
+    timings["predict"] = round((time.perf_counter() - t1) * 1000, 1)
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 1)
+    return build_result(extracted, y01, bundle)
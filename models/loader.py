@@ -1,2 +1,223 @@
-def get_versions():
-    return {"model_version": "v0.1"}
+"""
+Modelo que se sirve: carga, versión y recambio en caliente.
+
+Layout de models/:
+    releases/<versión>/   feature_spec.json + rf_model.forest/ (o rf_model.pkl) + model_card.json
+    CURRENT               nombre del release activo; se reemplaza con os.replace (atómico)
+Sin CURRENT se sirve el layout plano de models/ (feature_spec.json, rf_model.*),
+cómodo para desarrollo pero sin garantía de que modelo y spec cambien juntos.
+
+El bosque compilado se abre con np.load(mmap_mode="r"): todos los procesos de
+la máquina comparten una sola copia en el page cache del sistema. Cada proceso
+revisa CURRENT (y los mtimes) como mucho cada models.poll_s segundos; si cambió
+carga el release nuevo completo y recién entonces reemplaza la referencia, así
+los pedidos en curso terminan con el modelo que tomaron.
+
+Uso:
+    python -m models.loader --list
+    python -m models.loader --publish        # publica el layout plano como release y lo activa
+    python -m models.loader --use <versión>  # activa otro release (rollback)
+"""
+import argparse, hashlib, json, os, pathlib, shutil, threading, time
+from typing import Any, Dict, List, Optional
+
+MODELS = pathlib.Path(__file__).resolve().parent
+RELEASES = MODELS / "releases"
+CURRENT = MODELS / "CURRENT"
+
+_ARTIFACTS = ["feature_spec.json", "rf_model.forest", "rf_model.pkl", "model_card.json"]
+
+
+class ModelBundle:
+    """Modelo + feature spec de un mismo release, cargados juntos."""
+
+    def __init__(self, path: pathlib.Path, model, spec: Dict[str, Any], version: str, kind: str,
+                 load_ms: float, stamp: tuple):
+        self.path = path
+        self.model = model
+        self.spec = spec
+        self.features: List[str] = spec["features"]
+        self.version = version
+        self.kind = kind
+        self.load_ms = load_ms
+        self.loaded_at = time.time()
+        self.stamp = stamp
+
+
+def _active_dir() -> pathlib.Path:
+    try:
+        name = CURRENT.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return MODELS
+    return RELEASES / name if name else MODELS
+
+def _mtime(p: pathlib.Path) -> Optional[int]:
+    try:
+        return p.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _stamp(d: pathlib.Path) -> tuple:
+    """Cambia si cambia el release activo o, en el layout plano, alguno de sus archivos."""
+    return (str(d), _mtime(d / "feature_spec.json"), _mtime(d / "rf_model.forest" / "meta.json"),
+            _mtime(d / "rf_model.pkl"))
+
+def _use_forest(d: pathlib.Path) -> bool:
+    # el bosque compilado vale si no es más viejo que el .pkl
+    meta, pkl = d / "rf_model.forest" / "meta.json", d / "rf_model.pkl"
+    return meta.exists() and (not pkl.exists() or meta.stat().st_mtime >= pkl.stat().st_mtime)
+
+def _digest(d: pathlib.Path) -> str:
+    """Hash de la spec y los artefactos que se sirven (versión del layout plano)."""
+    h = hashlib.sha256((d / "feature_spec.json").read_bytes())
+    files = sorted((d / "rf_model.forest").iterdir()) if _use_forest(d) else [d / "rf_model.pkl"]
+    for f in files:
+        with open(f, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()[:12]
+
+def load_bundle(d: pathlib.Path) -> ModelBundle:
+    t0 = time.perf_counter()
+    stamp = _stamp(d)
+    spec = json.loads((d / "feature_spec.json").read_text(encoding="utf-8"))
+    if _use_forest(d):
+        from models.forest import load_forest
+        model, kind = load_forest(d / "rf_model.forest", mmap=True), "forest"
+    else:
+        import joblib
+        # mmap solo alcanza a los arrays que joblib guarda sueltos; el resto se deserializa
+        model, kind = joblib.load(d / "rf_model.pkl", mmap_mode="r"), "pkl"
+    version = _release_info(d, stamp)["model_version"]
+    return ModelBundle(d, model, spec, version, kind, round((time.perf_counter() - t0) * 1000, 1), stamp)
+
+
+_info: Optional[tuple] = None  # (stamp, versiones) del último release consultado
+
+def _release_info(d: pathlib.Path, stamp: tuple) -> Dict[str, Any]:
+    """Versión del release `d` sin cargar el modelo; el hash del layout plano se recalcula solo si cambia el stamp."""
+    global _info
+    info = _info
+    if info is not None and info[0] == stamp:
+        return info[1]
+    spec = json.loads((d / "feature_spec.json").read_text(encoding="utf-8"))
+    out = {"model_version": d.name if d.parent == RELEASES else f"dev-{_digest(d)}",
+           "feature_spec_version": spec.get("version"), "model_kind": "forest" if _use_forest(d) else "pkl"}
+    _info = (stamp, out)
+    return out
+
+
+_bundle: Optional[ModelBundle] = None
+_checked_at = 0.0
+_poll_s = 2.0
+_watch = True
+_lock = threading.Lock()
+
+def configure(mcfg: Dict[str, Any]):
+    """Sección `models` de app.yaml: watch (recambio en caliente) y poll_s."""
+    global _poll_s, _watch
+    _poll_s = float(mcfg.get("poll_s", 2.0))
+    _watch = bool(mcfg.get("watch", True))
+
+def get_bundle() -> ModelBundle:
+    """El modelo activo; lo carga la primera vez y lo recambia si se publicó otro."""
+    global _bundle, _checked_at
+    b = _bundle
+    now = time.monotonic()
+    if b is not None and (not _watch or now - _checked_at < _poll_s):
+        return b
+    with _lock:
+        if _bundle is not None and (not _watch or now - _checked_at < _poll_s):
+            return _bundle
+        _checked_at = now
+        d = _active_dir()
+        if _bundle is not None and _stamp(d) == _bundle.stamp:
+            return _bundle
+        try:
+            new = load_bundle(d)
+        except Exception as e:
+            if _bundle is None:
+                raise
+            # release a medio copiar o roto: se sigue sirviendo el anterior
+            print(f"[MODEL] no se pudo cargar {d}: {type(e).__name__}: {e}; sigue {_bundle.version}")
+            return _bundle
+        if _bundle is not None:
+            print(f"[MODEL] {_bundle.version} -> {new.version} ({new.load_ms} ms)")
+        _bundle = new
+        return new
+
+def get_versions() -> Dict[str, Any]:
+    """
+    Versiones del release activo leídas de CURRENT y la spec: no carga el modelo
+    (el proceso de la API no necesita una copia propia). Si este proceso ya lo
+    tiene cargado se agregan loaded_at y load_ms.
+    """
+    d = _active_dir()
+    stamp = _stamp(d)
+    out = dict(_release_info(d, stamp))
+    b = _bundle
+    if b is not None and b.stamp == stamp:
+        out.update(loaded_at=int(b.loaded_at), load_ms=b.load_ms)
+    return out
+
+
+def publish_release(src: pathlib.Path = MODELS, keep: int = 5) -> str:
+    """
+    Copia modelo + spec (+ card) de `src` a releases/<versión> y lo activa
+    reemplazando CURRENT de forma atómica. Conserva los últimos `keep` releases.
+    """
+    src = pathlib.Path(src)
+    forest = _use_forest(src)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{_digest(src)[:8]}"
+    RELEASES.mkdir(parents=True, exist_ok=True)
+    tmp = RELEASES / f".{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    for art in _ARTIFACTS:
+        p = src / art
+        if not p.exists() or (art == "rf_model.pkl" and forest) or (art == "rf_model.forest" and not forest):
+            continue
+        if p.is_dir():
+            shutil.copytree(p, tmp / art)
+        else:
+            shutil.copy2(p, tmp / art)
+    os.replace(tmp, RELEASES / name)
+    use_release(name)
+    if keep > 0:
+        # los nombres empiezan con la fecha: orden cronológico
+        for old in list_releases()[:-keep]:
+            shutil.rmtree(RELEASES / old, ignore_errors=True)
+    return name
+
+def use_release(name: str):
+    if not (RELEASES / name / "feature_spec.json").exists():
+        raise SystemExit(f"No existe el release {name}")
+    tmp = CURRENT.with_name(CURRENT.name + ".tmp")
+    tmp.write_text(name + "\n", encoding="utf-8")
+    os.replace(tmp, CURRENT)
+
+def list_releases() -> List[str]:
+    if not RELEASES.exists():
+        return []
+    return sorted(p.name for p in RELEASES.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Releases del modelo servido")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--list", action="store_true")
+    g.add_argument("--publish", action="store_true", help="publica models/ (layout plano) y lo activa")
+    g.add_argument("--use", metavar="VERSION", help="activa un release existente")
+    args = ap.parse_args()
+
+    if args.publish:
+        print(f"[MODEL] publicado y activo: {publish_release()}")
+    elif args.use:
+        use_release(args.use)
+        print(f"[MODEL] activo: {args.use}")
+    else:
+        active = _active_dir().name if CURRENT.exists() else None
+        for name in list_releases():
+            print(("* " if name == active else "  ") + name)
+        if active is None:
+            print("(sin CURRENT: se sirve el layout plano de models/)")
@@ -1,5 +1,5 @@
-import os, re
-from typing import Dict, Any, List, Tuple
+import bisect, re
+from typing import Dict, Any, List, Optional, Tuple
 
 DATE_RE = re.compile(r"\b(\d{2}[/-]\d{2}[/-]\d{4}|\d{4}[/-]\d{2}[/-]\d{2})\b")
 
@@ -13,6 +13,27 @@ VTO_RE = re.compile(r"\b(venc(?:imiento)?|vto\.?|expira|vigencia|validez)\b", re
 
 EMISOR_RE = re.compile(r"\b(aseguradora|compañ[ií]a|provincia seguros|sancor|zurich|seguro|registro|ministerio|entidad|dnrpa|vtv|verificaci[oó]n)\b", re.I)
 
+LONG_TOKEN_RE = re.compile(r"\b[A-Z0-9]{15,20}\b")
+
+# Un único patrón que recorre cada página una vez y clasifica cada coincidencia
+# por el nombre del grupo. Todos los patrones empiezan en borde de palabra, así
+# que el \b se factoriza y los lookahead (?=[0-9]) / (?=[A-Z]) descartan rápido
+# las ramas que no pueden aplicar. Los patrones no se solapan entre sí salvo
+# palabras clave de 3 letras que también parecen patente ("VTV 123"), que se
+# resuelven en scan_page.
+def _tail(rx: "re.Pattern") -> str:
+    assert rx.pattern.startswith(r"\b")
+    return rx.pattern[2:]
+
+_SCAN_RE = re.compile(
+    r"\b(?:"
+    rf"(?=[0-9])(?:(?P<date>{_tail(DATE_RE)})|(?P<cuit>{_tail(CUIT_RE)})|(?P<dtoken>{_tail(LONG_TOKEN_RE)}))"
+    rf"|(?P<vto>(?i:{_tail(VTO_RE)}))"
+    rf"|(?P<emisor>(?i:{_tail(EMISOR_RE)}))"
+    rf"|(?=[A-Z])(?:(?P<token>{_tail(LONG_TOKEN_RE)})|(?P<plate>{_tail(PLATE_RE)}))"
+    r")"
+)
+
 PERSON_LIKE = re.compile(r"^[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)+$")
 
 SUSP_SOFTWARE = ["photoshop", "gimp", "illustrator", "corel", "paint.net", "canva", "inkscape"]
@@ -48,29 +69,83 @@ def _cuit_is_valid(raw: str) -> bool:
     return check == int(digits[-1])
 
 
-def summarize_text(texts: List[str]) -> Dict[str, Any]:
-    joined = "\n".join(t or "" for t in texts)
-    has_date = bool(DATE_RE.search(joined))
-    length = len(joined)
-
-    has_patente = bool(PLATE_RE.search(joined))
-    has_vin = bool(VIN_RE.search(joined))
-    has_cuit = bool(CUIT_RE.search(joined))
-    has_vencimiento = bool(VTO_RE.search(joined))
-    has_entidad_emisora = bool(EMISOR_RE.search(joined))
+def scan_page(text: str, page: int) -> List[Dict[str, Any]]:
+    """Coincidencias de una página: [{"kind", "value", "page", "offset"}]."""
+    out: List[Dict[str, Any]] = []
+    for m in _SCAN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind in ("token", "dtoken"):
+            kind = "token"
+            tok = m.group(0)
+            if len(tok) == 17 and VIN_RE.fullmatch(tok):
+                kind = "vin"
+            elif len(tok) == 17 and any(ch in tok for ch in "IOQ"):
+                kind = "vin_suspect"
+        elif kind in ("vto", "emisor"):
+            pm = PLATE_RE.match(text, m.start())
+            if pm:
+                out.append({"kind": "plate", "value": pm.group(0), "page": page, "offset": pm.start()})
+        out.append({"kind": kind, "value": m.group(0), "page": page, "offset": m.start()})
+    return out
+
+
+def summarize_text(texts: List[str], page_numbers: Optional[List[int]] = None,
+                   sections: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Recorre el texto de cada página una sola vez con _SCAN_RE y arma los flags de
+    campos y los agregados por página. No incluye el texto crudo. `page_numbers`
+    da el número real de cada página cuando solo se analizó una parte del documento.
+    `sections` (HTML, una sola página) son rangos {"title", "start", "end"} del
+    texto: se agrega qué campos aparecen en cada sección.
+    """
+    texts = [t or "" for t in texts]
+    numbers = page_numbers or range(1, len(texts) + 1)
+    matches: List[Dict[str, Any]] = []
+    plates_per_page = []
+    pages_with_text = 0
+    for i, text in zip(numbers, texts):
+        page_matches = scan_page(text, i)
+        matches.extend(page_matches)
+        if text.strip():
+            pages_with_text += 1
+            plates_per_page.append({"".join(m["value"].split()) for m in page_matches if m["kind"] == "plate"})
+
+    kinds = {m["kind"] for m in matches}
+    total_chars = sum(len(t) for t in texts)
+    common_plates = set.intersection(*plates_per_page) if plates_per_page else set()
+    first_cuit = next((m["value"] for m in matches if m["kind"] == "cuit"), None)
 
     return {
-        "has_date": has_date,
-        "length": length,
-        "has_patente": has_patente,
-        "has_vin": has_vin,
-        "has_cuit": has_cuit,
-        "has_vencimiento": has_vencimiento,
-        "has_entidad_emisora": has_entidad_emisora,
-        "raw_text": joined  
+        "has_date": "date" in kinds,
+        "length": total_chars + max(0, len(texts) - 1),
+        "has_patente": "plate" in kinds,
+        "has_vin": "vin" in kinds,
+        "has_cuit": "cuit" in kinds,
+        "has_vencimiento": "vto" in kinds,
+        "has_entidad_emisora": "emisor" in kinds,
+        "pages": len(texts),
+        "total_chars": total_chars,
+        "pages_with_text": pages_with_text,
+        "chars_per_page_mean": round(total_chars / len(texts), 2) if texts else 0.0,
+        "same_plate_all_pages": bool(common_plates),
+        "first_cuit": first_cuit,
+        "vin_suspect": "vin_suspect" in kinds,
+        "matches": [m for m in matches if m["kind"] != "token"],
+        **({"sections": _section_fields(sections, matches)} if sections else {}),
     }
 
 
+def _section_fields(sections: List[Dict[str, Any]], matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    starts = [sec["start"] for sec in sections]
+    fields: List[set] = [set() for _ in sections]
+    for m in matches:
+        i = bisect.bisect_right(starts, m["offset"]) - 1
+        if i >= 0 and m["kind"] != "token":
+            fields[i].add(m["kind"])
+    return [{"title": sec["title"], "chars": sec["end"] - sec["start"], "fields": sorted(f)}
+            for sec, f in zip(sections, fields)]
+
+
 def reasons_from_metadata(meta: dict) -> List[Tuple[str, str, float]]:
     reasons: List[Tuple[str, str, float]] = []
     prod = (meta.get("Producer") or "").strip()
@@ -113,17 +188,13 @@ def reasons_from_text(doc_type: str, text_summary: Dict[str, Any]) -> List[Tuple
     if text_summary["length"] < 120:
         r.append(("OCR_TEXT_TOO_SHORT", "Muy poco texto reconocido (posible baja calidad)", 0.10))
 
-    m_cuit = CUIT_RE.search(text_summary["raw_text"])
-    if m_cuit:
-        if not _cuit_is_valid(m_cuit.group(0)):
+    first_cuit = text_summary.get("first_cuit")
+    if first_cuit:
+        if not _cuit_is_valid(first_cuit):
             r.append(("OCR_INVALID_CUIT", "CUIT/CUIL detectado con dígito verificador inválido", 0.10))
 
-
-    long_alnum = re.findall(r"\b[A-Z0-9]{15,20}\b", text_summary["raw_text"])
-    for token in long_alnum:
-        if len(token) == 17 and not VIN_RE.fullmatch(token) and any(ch in token for ch in "IOQ"):
-            r.append(("OCR_VIN_FORMAT_SUSPECT", "Secuencia tipo VIN con caracteres inválidos (I/O/Q)", 0.08))
-            break
+    if text_summary.get("vin_suspect"):
+        r.append(("OCR_VIN_FORMAT_SUSPECT", "Secuencia tipo VIN con caracteres inválidos (I/O/Q)", 0.08))
 
     if doc_type in ["SEGURO", "VTV"] and not text_summary.get("has_vencimiento", False):
         r.append(("OCR_MISSING_VIGENCIA", "No se detecta campo de vigencia/vencimiento esperado", 0.06))
@@ -134,46 +205,83 @@ def reasons_from_text(doc_type: str, text_summary: Dict[str, Any]) -> List[Tuple
     return r
 
 
-def reasons_from_images(images: List[str]) -> List[Tuple[str, str, float]]:
-    r: List[Tuple[str, str, float]] = []
+def _laplacian_var(gray, strip_rows: int = 512) -> float:
+    """
+    Varianza del Laplaciano (nitidez) por franjas horizontales en int16, en lugar
+    de una imagen float64 completa. Cada franja lleva una fila real de contexto
+    arriba y abajo, así el resultado coincide con el cálculo sobre toda la página.
+    """
+    import cv2
+    h = gray.shape[0]
+    n, total, total_sq = 0, 0.0, 0.0
+    for y0 in range(0, h, strip_rows):
+        y1 = min(h, y0 + strip_rows)
+        a, b = max(0, y0 - 1), min(h, y1 + 1)
+        lap = cv2.Laplacian(gray[a:b], cv2.CV_16S)
+        core = lap[y0 - a: y0 - a + (y1 - y0)]
+        mean, std = cv2.meanStdDev(core)
+        mean, std, cnt = float(mean[0, 0]), float(std[0, 0]), core.size
+        total += mean * cnt
+        total_sq += (std * std + mean * mean) * cnt
+        n += cnt
+    if n == 0:
+        return 0.0
+    mu = total / n
+    return total_sq / n - mu * mu
+
+
+def image_page_stats(page: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Señales de calidad de una página ya decodificada ({"image": array gris, "format", "bytes"}).
+    Se calcula mientras la página está en memoria para no tener que volver a leerla.
+    """
+    img = page["image"]
+    h, w = int(img.shape[0]), int(img.shape[1])
+    stats: Dict[str, Any] = {
+        "page": page.get("page"), "width": w, "height": h, "min_side": min(w, h),
+        "format": page.get("format"), "bytes": page.get("bytes"), "dpi": page.get("dpi"),
+        "bpp": None, "blur_var": None,
+    }
+    if page.get("bytes") is not None:
+        stats["bpp"] = page["bytes"] / float(max(1, w * h))
     try:
-        from PIL import Image
-        import os
-
-        for p in images:
-            try:
-                with Image.open(p) as im:
-                    w, h = im.width, im.height
-                    area = w * h
-                    if area < 400 * 400:  
-                        r.append(("IMAGE_LOW_RES", "Resolución de página muy baja", 0.10))
-                        break
-
-                    try:
-                        file_size = os.path.getsize(p)
-                        bpp = file_size / float(max(1, area))
-                        if (im.format or "").upper() in ("JPG", "JPEG") and bpp < 0.08:
-                            r.append(("IMAGE_OVERCOMPRESSED", "Imagen JPEG con compresión agresiva", 0.05))
-                    except Exception:
-                        pass
-            except Exception:
-                continue
-
-        try:
-            import cv2
-            import numpy as np
-            for p in images:
-                img = cv2.imdecode(np.fromfile(p, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
-                if img is None:
-                    continue
-                fm = cv2.Laplacian(img, cv2.CV_64F).var()
-                if fm < 20.0:  
-                    r.append(("IMAGE_BLURRY", "Imagen borrosa (baja nitidez)", 0.08))
-                    break
-        except Exception:
-            pass
-
+        import cv2
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        stats["blur_var"] = round(_laplacian_var(gray), 3)
     except Exception:
         pass
+    return stats
+
+
+def summarize_images(stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agregados por documento de las señales de imagen (features del modelo)."""
+    if not stats:
+        return {"min_resolution_px": 0, "low_res_flag": False, "blur_var_min": None}
+    blurs = [st["blur_var"] for st in stats if st.get("blur_var") is not None]
+    return {
+        "min_resolution_px": min(st["min_side"] for st in stats),
+        "low_res_flag": any(st["width"] * st["height"] < 400 * 400 for st in stats),
+        "blur_var_min": min(blurs) if blurs else None,
+        "per_page": [{"page": st["page"], "width": st["width"], "height": st["height"],
+                      "blur_var": st["blur_var"]} for st in stats],
+    }
+
+
+def reasons_from_image_stats(stats: List[Dict[str, Any]]) -> List[Tuple[str, str, float]]:
+    r: List[Tuple[str, str, float]] = []
+    for st in stats:
+        area = st["width"] * st["height"]
+        if area < 400 * 400:
+            r.append(("IMAGE_LOW_RES", "Resolución de página muy baja", 0.10))
+            break
+        if st.get("bpp") is not None:
+            if (st.get("format") or "").upper() in ("JPG", "JPEG") and st["bpp"] < 0.08:
+                r.append(("IMAGE_OVERCOMPRESSED", "Imagen JPEG con compresión agresiva", 0.05))
+
+    for st in stats:
+        fm = st.get("blur_var")
+        if fm is not None and fm < 20.0:
+            r.append(("IMAGE_BLURRY", "Imagen borrosa (baja nitidez)", 0.08))
+            break
 
     return r
@@ -0,0 +1,106 @@
+"""
+Texto de documentos HTML (informes de DNRPA y similares guardados desde el navegador).
+
+Se parsea en streaming con html.parser.HTMLParser de la stdlib: el archivo se lee
+en chunks, el contenido de script/style/noscript/template se descarta sin
+acumularlo y el espacio en blanco se colapsa al vuelo, así la memoria depende
+de `max_chars` y no del tamaño de la página. Al llegar a `max_chars` se deja de
+leer el archivo.
+
+El texto resultante es el mismo que daba BeautifulSoup.get_text(separator=" ")
+con el espacio colapsado: un espacio entre nodos de texto distintos. Además cada
+encabezado h1-h6 abre una sección nueva; las secciones se devuelven como rangos
+del texto, para ubicar en qué parte del informe aparece cada campo.
+"""
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+SKIP_TAGS = {"script", "style", "noscript", "template"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+CHUNK_CHARS = 64 * 1024
+
+
+class _TextExtractor(HTMLParser):
+
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = int(max_chars or 0)
+        self.parts: List[str] = []
+        self.length = 0
+        self.sections: List[Dict[str, Any]] = [{"title": "", "start": 0}]
+        self._skip = 0          # profundidad dentro de script/style/...
+        self._boundary = False  # hubo un tag desde el último texto: va un espacio
+        self._heading: Optional[List[str]] = None
+
+    @property
+    def full(self) -> bool:
+        return bool(self.max_chars) and self.length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in HEADING_TAGS and not self._skip:
+            # la sección arranca donde va a ir la próxima palabra
+            start = self.length + (1 if self.length else 0)
+            if self.sections[-1]["start"] >= start and not self.sections[-1]["title"]:
+                self.sections.pop()
+            self.sections.append({"title": "", "start": start})
+            self._heading = []
+        self._boundary = True
+
+    def handle_startendtag(self, tag, attrs):
+        self._boundary = True
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in HEADING_TAGS and self._heading is not None:
+            self.sections[-1]["title"] = " ".join(self._heading)[:120]
+            self._heading = None
+        self._boundary = True
+
+    def handle_comment(self, data):
+        self._boundary = True
+
+    def handle_data(self, data):
+        if self._skip or self.full:
+            return
+        space = self._boundary or data[:1].isspace()
+        self._boundary = data[-1:].isspace()
+        words = data.split()
+        if not words:
+            self._boundary = self._boundary or space
+            return
+        if self._heading is not None:
+            self._heading.extend(words)
+        text = " ".join(words)
+        if space and self.length:
+            text = " " + text
+        if self.max_chars and self.length + len(text) > self.max_chars:
+            text = text[:self.max_chars - self.length]
+        self.parts.append(text)
+        self.length += len(text)
+
+
+def extract_html(html_path: str, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    """
+    {"text", "sections": [{"title", "start", "end"}], "truncated"}. Las secciones
+    son rangos de "text"; la primera (título vacío) es lo que hay antes del primer
+    encabezado y se omite si no tiene texto.
+    """
+    parser = _TextExtractor(max_chars)
+    with open(html_path, "r", encoding="utf-8", errors="ignore") as f:
+        for chunk in iter(lambda: f.read(CHUNK_CHARS), ""):
+            parser.feed(chunk)
+            if parser.full:
+                break
+        else:
+            parser.close()
+    text = "".join(parser.parts)
+    sections = []
+    for i, sec in enumerate(parser.sections):
+        end = min(parser.sections[i + 1]["start"] - 1, len(text)) if i + 1 < len(parser.sections) else len(text)
+        start = min(sec["start"], len(text))
+        if end > start or sec["title"]:
+            sections.append({"title": sec["title"], "start": start, "end": max(start, end)})
+    return {"text": text, "sections": sections, "truncated": parser.full}
@@ -1,6 +1,5 @@
 import os, re, mimetypes, tempfile, shutil, subprocess
-from typing import List, Tuple
-import requests
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 
 HTTP_RE = re.compile(r"^https?://", re.IGNORECASE)
 
@@ -18,6 +17,7 @@ def ensure_local_file(path_or_url: str, workdir: str) -> Tuple[str, str]:
     Devuelve (local_path, temp_dir). Si descargó, temp_dir es la carpeta que creó.
     """
     if HTTP_RE.match(path_or_url):
+        import requests
         temp_dir = tempfile.mkdtemp(dir=workdir)
         local_path = os.path.join(temp_dir, f"download{sniff_ext(path_or_url)}")
         with requests.get(path_or_url, stream=True, timeout=30) as r:
@@ -28,24 +28,131 @@ def ensure_local_file(path_or_url: str, workdir: str) -> Tuple[str, str]:
     else:
         return os.path.abspath(path_or_url), None
 
-def pdf_to_images(pdf_path: str, out_dir: str, dpi: int = 300) -> List[str]:
-    os.makedirs(out_dir, exist_ok=True)
-    out_prefix = os.path.join(out_dir, "page")
-    cmd = ["pdftoppm", "-png", "-r", str(dpi), pdf_path, out_prefix]
-    subprocess.run(cmd, check=True)
-    imgs = sorted([os.path.join(out_dir, f) for f in os.listdir(out_dir) if f.startswith("page") and f.endswith(".png")])
-    return imgs
 
+def _read_pnm(stream) -> Optional[Any]:
+    """Lee una imagen PGM/PPM binaria (P5/P6) del stream; None si el stream terminó."""
+    import numpy as np
+    tokens, tok = [], b""
+    while len(tokens) < 4:
+        ch = stream.read(1)
+        if not ch:
+            if not tokens and not tok:
+                return None
+            raise ValueError("Stream PNM truncado")
+        if ch == b"#" and not tok:
+            while ch not in (b"\n", b""):
+                ch = stream.read(1)
+            continue
+        if ch.isspace():
+            if tok:
+                tokens.append(tok)
+                tok = b""
+            continue
+        tok += ch
+    magic, w, h, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+    if magic not in (b"P5", b"P6") or maxval > 255:
+        raise ValueError(f"Formato PNM no soportado: {magic!r}")
+    channels = 3 if magic == b"P6" else 1
+    buf = bytearray(w * h * channels)
+    view, got = memoryview(buf), 0
+    while got < len(buf):
+        n = stream.readinto(view[got:])
+        if not n:
+            raise ValueError("Stream PNM truncado")
+        got += n
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    return arr.reshape((h, w, 3) if channels == 3 else (h, w))
 
-def html_to_text(html_path: str) -> str:
-    from bs4 import BeautifulSoup
-    with open(html_path, "r", encoding="utf-8", errors="ignore") as f:
-        html = f.read()
-    soup = BeautifulSoup(html, "html.parser")
 
-    for tag in soup(["script", "style", "noscript"]):
-        tag.decompose()
-    text = soup.get_text(separator=" ")
+def iter_pdf_pages(pdf_path: str, dpi: int = 300, first: int = None, last: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    Rasteriza el PDF con pdftoppm en escala de grises y va entregando cada página
+    como array en memoria (PGM crudo por pipe), sin escribir PNGs a disco.
+    """
+    cmd = ["pdftoppm", "-gray", "-r", str(dpi)]
+    if first:
+        cmd += ["-f", str(first)]
+    if last:
+        cmd += ["-l", str(last)]
+    cmd.append(pdf_path)
+    # stderr a archivo: PDFs rotos pueden generar muchos warnings y llenar el pipe.
+    err_file = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file)
+    done = False
+    try:
+        page_no = first or 1
+        while True:
+            arr = _read_pnm(proc.stdout)
+            if arr is None:
+                break
+            yield {"page": page_no, "image": arr, "format": None, "bytes": None, "dpi": dpi}
+            page_no += 1
+        done = True
+    finally:
+        if not done:
+            proc.kill()
+        proc.stdout.close()
+        rc = proc.wait()
+        err_file.seek(0)
+        err = err_file.read()
+        err_file.close()
+        if done and rc != 0:
+            raise subprocess.CalledProcessError(rc, cmd, stderr=err)
+
+
+def pdf_text_layer(pdf_path: str) -> List[str]:
+    """Texto embebido de cada página (PDFs nativos); lista vacía si no se puede leer."""
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(pdf_path)
+        if reader.is_encrypted:
+            return []
+        texts = []
+        for page in reader.pages:
+            try:
+                texts.append(page.extract_text() or "")
+            except Exception:
+                texts.append("")
+        return texts
+    except Exception:
+        return []
+
+
+def pdf_page_count(pdf_path: str) -> Optional[int]:
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(pdf_path).pages)
+    except Exception:
+        return None
+
+
+def text_layer_usable(text: str, min_chars: int = 40) -> bool:
+    """Descarta capas de texto vacías, muy cortas o basura (fuentes sin mapa Unicode)."""
+    compact = "".join((text or "").split())
+    if not compact or len(compact) < min_chars:
+        return False
+    alnum = sum(ch.isalnum() for ch in compact)
+    return alnum / len(compact) >= 0.5
+
+
+def load_image_page(path: str) -> Dict[str, Any]:
+    """Decodifica una imagen una sola vez a escala de grises, conservando formato y tamaño en disco."""
+    import numpy as np
+    from PIL import Image
+    with Image.open(path) as im:
+        fmt = im.format
+        dpi = im.info.get("dpi")
+        if fmt == "JPEG":
+            # el decoder JPEG puede entregar directo la luminancia, sin pasar por RGB
+            im.draft("L", im.size)
+        arr = np.asarray(im.convert("L"))
+    return {
+        "page": 1, "image": arr, "format": fmt, "bytes": os.path.getsize(path),
+        "dpi": int(round(dpi[0])) if dpi else None,
+    }
+
 
-    text = " ".join(text.split())
-    return text
\ No newline at end of file
+def html_to_text(html_path: str, max_chars: Optional[int] = None) -> str:
+    """Texto visible del HTML, sin script/style/noscript (ver pipeline/html_text.py)."""
+    from pipeline.html_text import extract_html
+    return extract_html(html_path, max_chars)["text"]
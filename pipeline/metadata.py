@@ -1,9 +1,141 @@
-import json, subprocess
+import atexit, json, queue, subprocess, threading, time
+from typing import Dict, Optional
 
-def read_metadata_exiftool(path: str) -> dict:
-    try:
-        out = subprocess.check_output(["exiftool", "-j", "-n", path], text=True)
-        arr = json.loads(out)
+EXIFTOOL_CMD = ["exiftool", "-stay_open", "True", "-@", "-",
+                "-common_args", "-j", "-n", "-charset", "filename=utf8"]
+
+
+class ExifToolProcess:
+    """
+    Un exiftool en modo -stay_open: recibe pedidos por stdin y responde por stdout
+    terminando cada respuesta con {readyN}. Evita pagar el arranque de Perl por archivo.
+    """
+
+    def __init__(self):
+        self._seq = 0
+        self._start()
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            EXIFTOOL_CMD, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace",
+        )
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._reader, args=(self.proc, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _reader(proc, lines):
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def restart(self):
+        self.kill()
+        self._start()
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.proc.stdin.write("-stay_open\nFalse\n")
+            self.proc.stdin.flush()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+    def execute(self, path: str, timeout_s: float) -> dict:
+        self._seq += 1
+        marker = f"{{ready{self._seq}}}"
+        self.proc.stdin.write(f"{path}\n-execute{self._seq}\n")
+        self.proc.stdin.flush()
+
+        out, deadline = [], time.monotonic() + timeout_s
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"exiftool no respondió en {timeout_s}s")
+            try:
+                line = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"exiftool no respondió en {timeout_s}s")
+            if line is None:
+                raise RuntimeError("exiftool terminó inesperadamente")
+            if line.strip() == marker:
+                break
+            out.append(line)
+        text = "".join(out).strip()
+        arr = json.loads(text) if text else []
         return arr[0] if arr else {}
+
+
+class ExifToolPool:
+    """Pool chico de procesos exiftool persistentes; se arrancan a demanda."""
+
+    def __init__(self, size: int = 1):
+        self.size = max(1, int(size))
+        self._idle: "queue.Queue[ExifToolProcess]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _acquire(self) -> ExifToolProcess:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                p = ExifToolProcess()
+                self._created += 1
+                self._all.append(p)
+                return p
+        return self._idle.get()
+
+    def read(self, path: str, timeout_s: float) -> dict:
+        p = self._acquire()
+        try:
+            if not p.alive():
+                p.restart()
+            try:
+                return p.execute(path, timeout_s)
+            except (TimeoutError, RuntimeError, OSError):
+                # proceso colgado o caído: se reinicia para el próximo pedido
+                p.restart()
+                raise
+        finally:
+            self._idle.put(p)
+
+    def close(self):
+        for p in self._all:
+            p.close()
+
+
+_POOLS: Dict[int, ExifToolPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(processes: int = 1) -> ExifToolPool:
+    with _POOLS_LOCK:
+        pool = _POOLS.get(processes)
+        if pool is None:
+            pool = _POOLS[processes] = ExifToolPool(processes)
+        return pool
+
+@atexit.register
+def _close_pools():
+    for pool in _POOLS.values():
+        pool.close()
+
+
+def read_metadata_exiftool(path: str, timeout_s: float = 10.0, processes: int = 1) -> dict:
+    try:
+        return get_pool(processes).read(path, timeout_s)
     except Exception:
         return {}
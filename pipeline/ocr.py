@@ -1,17 +1,247 @@
-from typing import List, Dict, Any
-import pytesseract
-from PIL import Image
-import time
+import os, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Iterable, Callable, Optional
 
-def ocr_images(images: List[str], lang: str = "spa") -> Dict[str, Any]:
-    texts, per_page = [], []
+_TESSEROCR = False  # sin resolver: se importa al crear el primer motor, no al importar el módulo
+
+# modos de segmentación de Tesseract (mismos números en tesserocr y en --psm)
+PSM_AUTO, PSM_SINGLE_BLOCK, PSM_SINGLE_LINE = 3, 6, 7
+
+def _tesserocr():
+    """API en C de Tesseract (cada worker mantiene el modelo cargado entre páginas), o None."""
+    global _TESSEROCR
+    if _TESSEROCR is False:
+        try:
+            import tesserocr
+        except ImportError:
+            tesserocr = None
+        _TESSEROCR = tesserocr
+    return _TESSEROCR
+
+def backend() -> str:
+    """
+    Backend que usan los motores: "tesserocr" o "pytesseract". Si tesserocr no
+    se importó todavía solo se busca el módulo (cysignals no se puede
+    inicializar fuera del thread principal, y /health corre en un thread).
+    """
+    if _TESSEROCR is False:
+        import importlib.util
+        return "tesserocr" if importlib.util.find_spec("tesserocr") is not None else "pytesseract"
+    return "tesserocr" if _TESSEROCR is not None else "pytesseract"
+
+
+class OCREngine:
+    """
+    Pool de workers de Tesseract que reparte las páginas entre cores y devuelve
+    los textos en el orden de entrada. Con `tesserocr` instalado cada thread
+    conserva su propia instancia caliente (traineddata cargado una sola vez);
+    sin él se usa pytesseract, que igual corre un proceso por página en paralelo.
+    """
+
+    def __init__(self, lang: str = "spa", workers: int = 0):
+        self.lang = lang
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.backend = "tesserocr" if _tesserocr() is not None else "pytesseract"
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        if self.backend == "pytesseract" and self.workers > 1:
+            # tesseract usa OpenMP internamente; con varias páginas en paralelo
+            # los threads de cada proceso compiten entre sí.
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = _tesserocr().PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def _recognize(self, image, psm: int = PSM_AUTO) -> Tuple[str, Optional[int]]:
+        """(texto, confianza) de una imagen o recorte con el backend del engine."""
+        if self.backend == "tesserocr":
+            api = self._api()
+            api.SetPageSegMode(psm)
+            if isinstance(image, str):
+                api.SetImageFile(image)
+            else:
+                api.SetImage(_as_pil(image))
+            # confianza media de las palabras (0-100), ya calculada por el reconocimiento
+            return api.GetUTF8Text(), int(api.MeanTextConf())
+        import pytesseract
+        # una sola corrida de tesseract: las palabras con su confianza, y el texto se rearma de ahí
+        data = pytesseract.image_to_data(image, lang=self.lang, config=f"--psm {psm}",
+                                         output_type=pytesseract.Output.DICT)
+        return _text_from_data(data)
+
+    def _ocr_one(self, image, cache=None, roi=None):
+        """
+        Una página: (texto, ms, confianza, de_cache, regiones). Con `roi` (kwargs de
+        pipeline.roi.text_regions) se detectan las regiones de texto acá y sus
+        recortes se encolan en el mismo pool; devuelve un _RoiPage que se completa
+        en _collect (esta tarea no espera a los recortes, así no bloquea un worker).
+        """
+        t0 = time.perf_counter()
+        key = None
+        if cache is not None:
+            # hash perceptual + idioma + DPI: una página de plantilla ya vista no pasa por Tesseract
+            from pipeline.page_cache import dhash
+            dpi = int(image.get("dpi") or 0) if isinstance(image, dict) else 0
+            # el texto por regiones no es el mismo que el de página completa: van separados
+            key = (dhash(image, cache.hash_size), self.lang + ("+roi" if roi is not None else ""), dpi)
+            hit = cache.get(*key)
+            if hit is not None:
+                return hit[0], (time.perf_counter() - t0) * 1000.0, hit[1], True, None
+        dpi = image.get("dpi") if isinstance(image, dict) else None
+        if isinstance(image, dict):
+            image = image["image"]
+        if roi is None:
+            text, conf = self._recognize(image)
+            if key is not None:
+                cache.put(*key, text, conf)
+            return text, (time.perf_counter() - t0) * 1000.0, conf, False, None
+        from pipeline.roi import text_regions
+        gray = _as_gray(image)
+        boxes = text_regions(gray, dpi=dpi, **roi)
+        crops = [self._pool.submit(self._recognize, gray[y0:y1, x0:x1], PSM_SINGLE_LINE if line else PSM_SINGLE_BLOCK)
+                 for x0, y0, x1, y1, line in boxes]
+        return _RoiPage(crops, t0, key, cache)
+
+    def _collect(self, fut) -> Tuple[str, float, Optional[int], bool, Optional[int]]:
+        res = fut.result()
+        if not isinstance(res, _RoiPage):
+            return res
+        parts = [c.result() for c in res.crops]
+        text = "".join(t if t.endswith("\n") else t + "\n" for t, _ in parts if t.strip())
+        # confianza de la página: promedio de los recortes pesado por caracteres
+        weighted = [(len(t), c) for t, c in parts if c is not None and t.strip()]
+        chars = sum(n for n, _ in weighted)
+        conf = int(round(sum(n * c for n, c in weighted) / chars)) if chars else None
+        if res.key is not None:
+            res.cache.put(*res.key, text, conf)
+        return text, (time.perf_counter() - res.t0) * 1000.0, conf, False, len(parts)
+
+    def ocr_pages(self, images: Iterable[Any], on_page: Callable = None, cache=None,
+                  roi: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float, Optional[int], bool, Optional[int]]]:
+        """
+        Devuelve [(texto, ms, confianza, de_cache, regiones)] en el mismo orden que
+        `images`. Acepta un iterable (p.ej. páginas que van saliendo de pdftoppm) y
+        mantiene a lo sumo 2*workers páginas en vuelo, así la memoria no crece con
+        el largo del PDF. `on_page(page)` se llama con cada página antes de encolarla.
+        `cache` es una PageCache opcional (pipeline/page_cache.py). Con `roi` se
+        OCRean solo las regiones de texto de cada página (regiones = cuántas).
+        """
+        results, pending = [], deque()
+        max_pending = 2 * self.workers
+        for image in images:
+            if on_page is not None:
+                on_page(image)
+            pending.append(self._pool.submit(self._ocr_one, image, cache, roi))
+            while len(pending) >= max_pending:
+                results.append(self._collect(pending.popleft()))
+        while pending:
+            results.append(self._collect(pending.popleft()))
+        return results
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for api in self._apis:
+            api.End()
+        self._apis.clear()
+
+
+class _RoiPage:
+    """Página en modo roi cuyos recortes todavía están en el pool."""
+
+    def __init__(self, crops, t0: float, key, cache):
+        self.crops, self.t0, self.key, self.cache = crops, t0, key, cache
+
+
+def _text_from_data(data: Dict[str, list]) -> Tuple[str, int]:
+    """
+    (texto, confianza media) de la salida de pytesseract.image_to_data: palabras
+    unidas por espacios, un renglón por línea y una línea en blanco entre
+    párrafos, como image_to_string; la confianza es 0 sin palabras, igual que
+    MeanTextConf de tesserocr.
+    """
+    lines: List[str] = []
+    confs: List[float] = []
+    prev = None
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not str(word).strip():
+            continue
+        line = (data["page_num"][i], data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if line == prev:
+            lines[-1] += " " + str(word).strip()
+        else:
+            if prev is not None and line[:3] != prev[:3]:
+                lines.append("")
+            lines.append(str(word).strip())
+            prev = line
+        confs.append(conf)
+    text = "\n".join(lines) + "\n" if lines else ""
+    return text, int(sum(confs) / len(confs)) if confs else 0
+
+def _as_gray(image):
+    import numpy as np
+    if isinstance(image, str):
+        from PIL import Image
+        with Image.open(image) as im:
+            return np.asarray(im.convert("L"))
+    if hasattr(image, "mode"):
+        return np.asarray(image.convert("L"))
+    return np.asarray(image)
+
+def _as_pil(image):
+    if hasattr(image, "__array_interface__") and not hasattr(image, "mode"):
+        from PIL import Image
+        return Image.fromarray(image)
+    return image
+
+
+_ENGINES: Dict[Tuple[str, int], OCREngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_engine(lang: str = "spa", workers: int = 0) -> OCREngine:
+    key = (lang, workers)
+    with _ENGINES_LOCK:
+        eng = _ENGINES.get(key)
+        if eng is None:
+            eng = _ENGINES[key] = OCREngine(lang=lang, workers=workers)
+        return eng
+
+
+def ocr_images(images: Iterable[Any], lang: str = "spa", workers: int = 0, on_page: Callable = None,
+               cache=None, roi: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    OCR de páginas: rutas, imágenes PIL, arrays o dicts de página ({"image": ...}).
+    `roi` activa el OCR por regiones (ver OCREngine.ocr_pages y pipeline/roi.py).
+    """
     t0 = time.time()
-    for i, img_path in enumerate(images, start=1):
-        text = pytesseract.image_to_string(Image.open(img_path), lang=lang)
-        texts.append(text)
-        per_page.append({"page": i, "chars": len(text)})
+    engine = get_engine(lang, workers)
+    # número de página real (p.ej. al OCRear solo algunas páginas del PDF)
+    numbers = []
+    def _track(image):
+        numbers.append(image.get("page") if isinstance(image, dict) else None)
+        if on_page is not None:
+            on_page(image)
+    results = engine.ocr_pages(images, on_page=_track, cache=cache, roi=roi)
+    texts = [t for t, _, _, _, _ in results]
+    per_page = [{"page": n or i, "chars": len(t), "time_ms": int(ms), "conf": conf,
+                 **({"cached": hit} if cache is not None else {}),
+                 **({"regions": regions} if regions is not None else {})}
+                for i, ((t, ms, conf, hit, regions), n) in enumerate(zip(results, numbers), start=1)]
     total = int(sum(p["chars"] for p in per_page))
     return {
         "texts": texts,
-        "stats": {"pages": len(images), "total_chars": total, "time_ms": int((time.time()-t0)*1000)}
+        "stats": {
+            "pages": len(results), "total_chars": total, "time_ms": int((time.time()-t0)*1000),
+            "engine": engine.backend, "workers": engine.workers, "mode": "roi" if roi is not None else "full",
+            "per_page": per_page,
+        }
     }
@@ -0,0 +1,186 @@
+"""
+Cache de OCR por página, indexada por hash perceptual de la imagen rasterizada.
+
+Las plantillas se repiten mucho (carátulas de aseguradoras, dorsos de VTV,
+términos y condiciones): una página cuyo hash queda a menos de `max_distance`
+bits de una ya vista reutiliza su texto sin pasar por Tesseract, aunque el
+resto del documento sea nuevo. La clave incluye idioma y DPI.
+
+El hash es un dHash de hash_size x hash_size bits. Para buscar vecinos sin
+recorrer toda la tabla se parte en max_distance + 1 bandas: dos hashes a
+distancia <= max_distance coinciden exacto en al menos una banda (palomar), y
+solo esos candidatos se comparan bit a bit.
+
+Ojo: un hash de baja resolución no distingue páginas que difieren en pocos
+caracteres (la misma póliza con otra patente): con hash_size 32 quedan a 1-2
+bits, con 64 a ~8. Por eso está apagada por defecto y usa hash_size 64 con
+max_distance chico: acierta con páginas idénticas o casi (la misma plantilla
+rasterizada de otro PDF), no con escaneos distintos del mismo papel.
+
+Uso:
+    python -m pipeline.page_cache --stats data/cache/ocr_pages.db
+"""
+import argparse, os, sqlite3, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+def dhash(image, hash_size: int = 64) -> bytes:
+    """dHash: compara cada celda con la vecina de la derecha en la imagen reducida."""
+    from PIL import Image
+    if isinstance(image, dict):
+        image = image["image"]
+    if isinstance(image, str):
+        with Image.open(image) as im:
+            im = im.convert("L")
+            im.load()
+    elif isinstance(image, np.ndarray):
+        im = Image.fromarray(image if image.ndim == 2 else image.mean(axis=2).astype(np.uint8))
+    else:
+        im = image.convert("L")
+    small = np.asarray(im.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+def _bands(h: bytes, n: int) -> List[bytes]:
+    step = -(-len(h) // n)
+    return [h[i:i + step] for i in range(0, len(h), step)]
+
+def _hamming(a: bytes, b: bytes) -> int:
+    return int(np.unpackbits(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+
+class PageCache:
+    """
+    Store SQLite local (WAL, compartible entre los procesos del pool) con
+    desalojo LRU por last_used y contadores de aciertos del proceso.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, max_distance: int = 2, hash_size: int = 64):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.max_distance = max(0, int(max_distance))
+        self.hash_size = int(hash_size)
+        self.n_bands = min(self.max_distance + 1, self.hash_size * self.hash_size // 8)
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        with self._conn() as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    id INTEGER PRIMARY KEY, lang TEXT NOT NULL, dpi INTEGER NOT NULL, hash BLOB NOT NULL,
+                    text TEXT NOT NULL, conf INTEGER, created REAL NOT NULL, last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0);
+                CREATE INDEX IF NOT EXISTS pages_lru ON pages(last_used);
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL, value BLOB NOT NULL,
+                    page_id INTEGER NOT NULL REFERENCES pages(id) ON DELETE CASCADE);
+                CREATE INDEX IF NOT EXISTS bands_value ON bands(band, value);
+                CREATE INDEX IF NOT EXISTS bands_page ON bands(page_id);
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # una conexión por thread de OCR
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA foreign_keys=ON")
+            self._local.con = con
+        return con
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, h: bytes, lang: str, dpi: int) -> Optional[Tuple[str, Optional[int]]]:
+        """(texto, confianza) de la página más cercana dentro de max_distance, o None."""
+        con = self._conn()
+        best = None
+        seen = set()
+        for i, value in enumerate(_bands(h, self.n_bands)):
+            rows = con.execute(
+                "SELECT p.id, p.hash, p.text, p.conf FROM bands b JOIN pages p ON p.id = b.page_id "
+                "WHERE b.band = ? AND b.value = ? AND p.lang = ? AND p.dpi = ?", (i, value, lang, dpi)).fetchall()
+            for pid, ph, text, conf in rows:
+                if pid in seen:
+                    continue
+                seen.add(pid)
+                d = _hamming(h, ph)
+                if d <= self.max_distance and (best is None or d < best[0]):
+                    best = (d, pid, text, conf)
+            if best is not None and best[0] == 0:
+                break
+        if best is None:
+            self._count(False)
+            return None
+        try:
+            con.execute("UPDATE pages SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), best[1]))
+        except sqlite3.OperationalError:
+            # otra escritura tiene la base tomada: el LRU se actualiza en el próximo acierto
+            pass
+        self._count(True)
+        return best[2], best[3]
+
+    def put(self, h: bytes, lang: str, dpi: int, text: str, conf: Optional[int] = None):
+        con = self._conn()
+        now = time.time()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            cur = con.execute("INSERT INTO pages (lang, dpi, hash, text, conf, created, last_used) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)", (lang, dpi, h, text, conf, now, now))
+            con.executemany("INSERT INTO bands (band, value, page_id) VALUES (?, ?, ?)",
+                            [(i, v, cur.lastrowid) for i, v in enumerate(_bands(h, self.n_bands))])
+            con.execute("COMMIT")
+        except sqlite3.OperationalError:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            return
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % 100 == 1
+        if prune:
+            self._evict(con)
+
+    def _evict(self, con: sqlite3.Connection):
+        """LRU: al pasar max_entries se borra hasta el 90% (así no se poda en cada put)."""
+        n = con.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        if n <= self.max_entries:
+            return
+        drop = n - int(self.max_entries * 0.9)
+        try:
+            con.execute("DELETE FROM pages WHERE id IN (SELECT id FROM pages ORDER BY last_used LIMIT ?)", (drop,))
+        except sqlite3.OperationalError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        n, hits = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM pages").fetchone()
+        looked = self.hits + self.misses
+        return {"entries": n, "max_entries": self.max_entries, "stored_hits": hits,
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / looked, 4) if looked else None}
+
+
+def cache_from_config(cfg: Dict[str, Any]) -> Optional[PageCache]:
+    ccfg = cfg.get("ocr_cache", {})
+    if not ccfg.get("enabled", False):
+        return None
+    return PageCache(ccfg.get("path", "./data/cache/ocr_pages.db"),
+                     max_entries=ccfg.get("max_entries", 50000),
+                     max_distance=ccfg.get("max_distance", 2),
+                     hash_size=ccfg.get("hash_size", 64))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Estado de la cache de OCR por página")
+    ap.add_argument("--stats", required=True, help="ruta de la base (ocr_cache.path)")
+    args = ap.parse_args()
+    st = PageCache(args.stats).stats()
+    print(f"[OCR CACHE] {st['entries']} páginas, {st['stored_hits']} aciertos acumulados")
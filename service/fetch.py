@@ -0,0 +1,207 @@
+import hashlib, ipaddress, pathlib, socket, tempfile, threading
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit, unquote
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from service.uploads import IngestedUpload, UploadRejected, CHUNK_SIZE, sniff_magic, _family
+
+
+class BlockedAddress(Exception):
+    """La conexión llegó a una IP que no es pública."""
+
+
+def _is_public(addr: str) -> bool:
+    ip = ipaddress.ip_address(addr.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+def check_url(url: str, allowed_hosts=(), allow_private: bool = False) -> str:
+    """
+    Valida una URL antes de pedirla: http(s), host en `allowed_hosts` (si hay) y,
+    salvo allow_private, que todas sus IPs sean públicas (ni 127.x, 10.x,
+    169.254.x, ::1, ...). Devuelve el host; si no, UploadRejected.
+    """
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        raise UploadRejected(400, "La URL debe ser http(s)")
+    host = parts.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        raise UploadRejected(403, f"Host no permitido: {host}")
+    if not allow_private:
+        try:
+            infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme.lower() == "https" else 80),
+                                       proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, UnicodeError):
+            raise UploadRejected(502, f"No se pudo resolver el host: {host}")
+        if not all(_is_public(info[4][0]) for info in infos):
+            raise UploadRejected(403, f"Host no permitido: {host}")
+    return host
+
+
+class _PublicOnly:
+    # el DNS se vuelve a resolver al conectar: lo que vale es la IP del socket ya conectado
+    def _new_conn(self):
+        sock = super()._new_conn()
+        if not _is_public(sock.getpeername()[0]):
+            sock.close()
+            raise BlockedAddress(f"Host no permitido: {self.host}")
+        return sock
+
+class _PublicHTTPConnection(_PublicOnly, HTTPConnection):
+    pass
+
+class _PublicHTTPSConnection(_PublicOnly, HTTPSConnection):
+    pass
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+class PublicOnlyAdapter(HTTPAdapter):
+    """
+    HTTPAdapter que corta la conexión (BlockedAddress) si el socket quedó
+    conectado a una IP no pública, antes de mandar el pedido o hacer el
+    handshake TLS. Cubre el DNS rebinding: un registro con TTL corto que pasa
+    check_url con una IP pública y al conectar apunta a 127.0.0.1.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PublicHTTPConnectionPool,
+                                                   "https": _PublicHTTPSConnectionPool}
+
+
+class URLFetcher:
+    """
+    Cliente HTTP compartido para bajar documentos por URL (p.ej. URLs firmadas de
+    object storage). Una sola requests.Session con pool de conexiones keep-alive
+    y un semáforo por host, así un host lento no acapara todas las descargas.
+
+    Las redirecciones se siguen a mano: cada Location pasa por check_url antes
+    de pedirla y, salvo allow_private, la sesión usa PublicOnlyAdapter.
+    """
+
+    def __init__(self, per_host: int = 4, pool_maxsize: int = 16, connect_timeout_s: float = 5,
+                 read_timeout_s: float = 30, queue_timeout_s: float = 10,
+                 allowed_hosts: Optional[List[str]] = None, max_redirects: int = 5, allow_private: bool = False):
+        self.per_host = max(1, int(per_host))
+        self.timeout = (float(connect_timeout_s), float(read_timeout_s))
+        self.queue_timeout_s = float(queue_timeout_s)
+        self.allowed_hosts = {h.lower() for h in (allowed_hosts or [])}
+        self.max_redirects = int(max_redirects)
+        self.allow_private = bool(allow_private)
+        self.session = requests.Session()
+        adapter_cls = HTTPAdapter if self.allow_private else PublicOnlyAdapter
+        adapter = adapter_cls(pool_connections=int(pool_maxsize), pool_maxsize=int(pool_maxsize))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _check_host(self, url: str) -> str:
+        return check_url(url, self.allowed_hosts, self.allow_private)
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    def fetch(self, url: str, limits: dict, workdir: str) -> IngestedUpload:
+        """
+        Descarga en streaming con las mismas validaciones que un upload: magic
+        bytes en el primer chunk, corte apenas se supera limits.max_bytes y
+        sha256 calculado mientras baja (para buscar en la cache antes de analizar).
+        Bloqueante: llamar desde un thread.
+        """
+        host = self._check_host(url)
+        max_bytes = int(limits.get("max_bytes") or 0)
+        allowed = {_family(e) for e in limits.get("allowed_ext", [])}
+        spool_max = int(limits.get("spool_max_bytes", 2 * 1024 * 1024))
+
+        sem = self._slot(host)
+        if not sem.acquire(timeout=self.queue_timeout_s):
+            raise UploadRejected(503, f"Demasiadas descargas en curso desde {host}")
+        try:
+            r = self._get(url)
+            for _ in range(self.max_redirects):
+                if not r.is_redirect:
+                    break
+                # el destino se valida antes de mandarle nada
+                location = urljoin(r.url, r.headers["Location"])
+                r.close()
+                self._check_host(location)
+                r = self._get(location)
+            if r.is_redirect:
+                r.close()
+                raise UploadRejected(502, "Demasiadas redirecciones")
+            with r:
+                if r.status_code >= 400:
+                    raise UploadRejected(502, f"La URL respondió {r.status_code}")
+                length = r.headers.get("Content-Length", "")
+                if max_bytes and length.isdigit() and int(length) > max_bytes:
+                    raise UploadRejected(413, f"El archivo supera el máximo de {max_bytes} bytes")
+                return self._consume(r, url, max_bytes, allowed, spool_max, workdir)
+        finally:
+            sem.release()
+
+    def _get(self, url: str) -> requests.Response:
+        try:
+            return self.session.get(url, stream=True, timeout=self.timeout, allow_redirects=False)
+        except BlockedAddress as e:
+            raise UploadRejected(403, str(e))
+        except requests.Timeout:
+            raise UploadRejected(504, "Timeout al descargar la URL")
+        except requests.RequestException as e:
+            raise UploadRejected(502, f"No se pudo descargar la URL: {type(e).__name__}")
+
+    def _consume(self, r, url: str, max_bytes: int, allowed: set, spool_max: int, workdir: str) -> IngestedUpload:
+        h, size, ext = hashlib.sha256(), 0, None
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_max, dir=workdir)
+        try:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                if not chunk:
+                    continue
+                if ext is None:
+                    ext = sniff_magic(chunk)
+                    if ext is None or (allowed and ext not in allowed):
+                        raise UploadRejected(415, "Tipo de archivo no soportado")
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadRejected(413, f"El archivo supera el máximo de {max_bytes} bytes")
+                h.update(chunk)
+                spool.write(chunk)
+            if ext is None:
+                raise UploadRejected(400, "Archivo vacío")
+        except requests.RequestException as e:
+            spool.close()
+            raise UploadRejected(502, f"Descarga interrumpida: {type(e).__name__}")
+        except BaseException:
+            spool.close()
+            raise
+        name = pathlib.PurePosixPath(unquote(urlsplit(url).path)).name or f"download{ext}"
+        return IngestedUpload(name, ext, h.hexdigest(), size, spool)
+
+    def close(self):
+        self.session.close()
+
+
+def fetcher_from_config(cfg: dict) -> URLFetcher:
+    fcfg = cfg.get("fetch", {})
+    return URLFetcher(
+        per_host=fcfg.get("per_host", 4),
+        pool_maxsize=fcfg.get("pool_maxsize", 16),
+        connect_timeout_s=fcfg.get("connect_timeout_s", 5),
+        read_timeout_s=fcfg.get("read_timeout_s", 30),
+        queue_timeout_s=fcfg.get("queue_timeout_s", 10),
+        allowed_hosts=fcfg.get("allowed_hosts") or [],
+        max_redirects=fcfg.get("max_redirects", 5),
+        allow_private=fcfg.get("allow_private", False),
+    )
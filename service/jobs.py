@@ -0,0 +1,355 @@
+"""
+Jobs asincrónicos de análisis: POST /jobs encola y GET /jobs/{id} consulta.
+
+Los jobs viven en un SQLite (jobs.dir/jobs.db) junto con una copia del archivo,
+así sobreviven a reinicios. Un JobWorker toma jobs con un lease que renueva
+mientras trabaja; si el proceso muere, el lease vence y otro worker retoma el job.
+
+El worker puede correr dentro de la API (jobs.embedded_worker) o aparte:
+    python -m service.jobs
+"""
+import asyncio, json, os, socket, sqlite3, time, uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from models.cache import cache_key
+from models.loader import get_versions
+from service import metrics
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    path TEXT,
+    sha256 TEXT,
+    language TEXT,
+    webhook_url TEXT,
+    webhook_status TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """Cola de jobs persistente en SQLite; segura entre threads y procesos."""
+
+    def __init__(self, db_path: str, lease_s: float = 60, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_s = float(lease_s)
+        self.max_attempts = max(1, int(max_attempts))
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._conn() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _conn(self):
+        # una conexión por operación: sqlite3 no comparte conexiones entre threads
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def create(self, filename: str, path: Optional[str], sha256: str, language: str,
+               webhook_url: Optional[str] = None, result: Optional[dict] = None) -> str:
+        """Encola un job; si ya se conoce el resultado (cache) nace terminado."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        status = DONE if result is not None else QUEUED
+        with self._conn() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, filename, path, sha256, language, webhook_url, result,"
+                " created_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, status, filename, path, sha256, language, webhook_url,
+                 json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 now, now if result is not None else None),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._conn() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Toma el job en cola más viejo (o uno con lease vencido) y lo marca running."""
+        now = time.time()
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # leases vencidos: el worker murió a mitad del job; los que agotaron
+                # los intentos quedan para reap()
+                db.execute("UPDATE jobs SET status = ?, lease_until = NULL"
+                           " WHERE status = ? AND lease_until < ? AND attempts < ?",
+                           (QUEUED, RUNNING, now, self.max_attempts))
+                row = db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                                 (QUEUED,)).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                db.execute("UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1,"
+                           " started_at = ?, lease_until = ? WHERE id = ?",
+                           (RUNNING, worker, now, now + self.lease_s, row["id"]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def reap(self) -> List[Dict[str, Any]]:
+        """
+        Marca failed los jobs con lease vencido que ya agotaron los intentos, borra
+        sus archivos y los devuelve ({id, path, webhook_url}) para avisar por webhook.
+        """
+        now = time.time()
+        reaped = []
+        with self._conn() as db:
+            rows = db.execute("SELECT id, path, webhook_url FROM jobs WHERE status = ? AND lease_until < ?"
+                              " AND attempts >= ?", (RUNNING, now, self.max_attempts)).fetchall()
+            for row in rows:
+                # con varios workers solo lo devuelve el que efectivamente lo cambió
+                cur = db.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL"
+                                 " WHERE id = ? AND status = ? AND lease_until < ?",
+                                 (FAILED, "El worker se interrumpió demasiadas veces", now, row["id"], RUNNING, now))
+                if cur.rowcount:
+                    reaped.append(dict(row))
+        for job in reaped:
+            if job["path"]:
+                try:
+                    os.unlink(job["path"])
+                except OSError:
+                    pass
+        return reaped
+
+    def renew(self, job_id: str, worker: str):
+        with self._conn() as db:
+            db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+                       (time.time() + self.lease_s, job_id, worker, RUNNING))
+
+    def finish(self, job_id: str, result: dict):
+        with self._conn() as db:
+            db.execute("UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ?,"
+                       " lease_until = NULL WHERE id = ?",
+                       (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str):
+        with self._conn() as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                       (FAILED, error, time.time(), job_id))
+
+    def counts(self) -> Dict[str, int]:
+        with self._conn() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0, **{r[0]: r[1] for r in rows}}
+
+    def set_webhook_status(self, job_id: str, status: str):
+        with self._conn() as db:
+            db.execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+
+def store_from_config(cfg: dict) -> JobStore:
+    jcfg = cfg.get("jobs", {})
+    return JobStore(
+        os.path.join(jcfg.get("dir", "./data/jobs"), "jobs.db"),
+        lease_s=jcfg.get("lease_s", 60),
+        max_attempts=jcfg.get("max_attempts", 3),
+    )
+
+def job_files_dir(cfg: dict) -> str:
+    """Carpeta donde quedan los archivos de jobs pendientes (no es el workdir temporal)."""
+    path = os.path.join(cfg.get("jobs", {}).get("dir", "./data/jobs"), "files")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Vista del job para GET /jobs/{id} y el webhook."""
+    out = {k: job[k] for k in ("id", "status", "filename", "language", "attempts",
+                               "created_at", "started_at", "finished_at")}
+    if job["status"] == DONE:
+        out["result"] = job["result"]
+    if job["status"] == FAILED:
+        out["error"] = job["error"]
+    if job.get("webhook_url"):
+        out["webhook_status"] = job.get("webhook_status")
+    return out
+
+
+def send_webhook(store: JobStore, job_id: str, timeout_s: float = 10, retries: int = 3,
+                 allow_private: bool = False):
+    """
+    POST del job terminado al webhook_url, con reintentos y backoff. Mismas
+    defensas que /risk-ml/url: el host se valida antes de cada intento, la
+    conexión solo llega a IPs públicas (salvo allow_private) y las
+    redirecciones no se siguen.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from service.fetch import BlockedAddress, PublicOnlyAdapter, check_url
+    from service.uploads import UploadRejected
+    job = store.get(job_id)
+    if job is None or not job.get("webhook_url"):
+        return
+    payload = public_job(job)
+    status = "failed"
+    with requests.Session() as session:
+        adapter = HTTPAdapter() if allow_private else PublicOnlyAdapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        for attempt in range(retries):
+            try:
+                check_url(job["webhook_url"], allow_private=allow_private)
+                r = session.post(job["webhook_url"], json=payload, timeout=timeout_s, allow_redirects=False)
+                if r.status_code < 300:
+                    status = "sent"
+                    break
+                status = f"failed: HTTP {r.status_code}"
+            except (UploadRejected, BlockedAddress) as e:
+                status = f"failed: {e}"
+                break
+            except requests.RequestException as e:
+                status = f"failed: {type(e).__name__}"
+            if attempt + 1 < retries:
+                time.sleep(2 ** attempt)
+    store.set_webhook_status(job_id, status)
+
+
+class JobWorker:
+    """
+    Toma jobs del JobStore y los corre en el AnalysisPool, con hasta `concurrency`
+    jobs a la vez. Mientras un job corre, renueva su lease cada lease_s / 3.
+    """
+
+    def __init__(self, store: JobStore, pool, cfg: dict, cache=None, shared_pool: bool = False):
+        jcfg = cfg.get("jobs", {})
+        self.store = store
+        self.pool = pool
+        self.cache = cache
+        # con el pool compartido (worker embebido) los jobs no pueden ocupar los
+        # lugares de /risk-ml; en un proceso aparte el pool es todo suyo
+        self.concurrency = int(jcfg.get("concurrency") or 0) or pool.processes
+        if shared_pool:
+            self.concurrency = min(self.concurrency, pool.background_share)
+        self.poll_s = float(jcfg.get("poll_s", 1.0))
+        self.webhook_timeout_s = float(jcfg.get("webhook_timeout_s", 10))
+        self.webhook_allow_private = bool(jcfg.get("webhook_allow_private", False))
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._task = None
+        self._running = set()
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        # los jobs en curso no se marcan: su lease vence y los retoma otro worker
+        if self._task is not None:
+            self._task.cancel()
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(self._task, *self._running, return_exceptions=True)
+
+    async def run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            try:
+                for dead in await asyncio.to_thread(self.store.reap):
+                    metrics.DOCS.inc(outcome="error")
+                    if dead["webhook_url"]:
+                        self._notify(dead["id"])
+                job = await asyncio.to_thread(self.store.claim, self.name)
+            except Exception:
+                job = None
+            if job is None:
+                slots.release()
+                await asyncio.sleep(self.poll_s)
+                continue
+            self._track(asyncio.ensure_future(self._process(job))).add_done_callback(lambda t: slots.release())
+
+    def _track(self, task: asyncio.Future) -> asyncio.Future:
+        """Tareas que stop() cancela y espera."""
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    def _notify(self, job_id: str):
+        # tarea aparte: un webhook caído (reintentos + backoff) no retiene el lugar del job
+        self._track(asyncio.ensure_future(asyncio.to_thread(
+            send_webhook, self.store, job_id, self.webhook_timeout_s, allow_private=self.webhook_allow_private)))
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.store.lease_s / 3)
+            await asyncio.to_thread(self.store.renew, job_id, self.name)
+
+    async def _process(self, job: Dict[str, Any]):
+        from models.infer_ml import analyze_document_ml
+        heartbeat = asyncio.ensure_future(self._heartbeat(job["id"]))
+        try:
+            if not job["path"] or not os.path.exists(job["path"]):
+                await asyncio.to_thread(self.store.fail, job["id"], "El archivo del job no existe")
+            else:
+                size = os.path.getsize(job["path"])
+                try:
+                    result = await self.pool.run(analyze_document_ml, job["path"], job["language"], False, wait=True)
+                except Exception as e:
+                    metrics.DOCS.inc(outcome="error")
+                    await asyncio.to_thread(self.store.fail, job["id"], f"Error en análisis ML: {e}")
+                else:
+                    metrics.observe_result(result, size)
+                    await asyncio.to_thread(self.store.finish, job["id"], result)
+                    versions = await asyncio.to_thread(get_versions)
+                    if (self.cache is not None and job["sha256"]
+                            and result["debug"].get("model_version") == versions["model_version"]):
+                        key = cache_key(job["sha256"], job["language"], versions)
+                        await asyncio.to_thread(self.cache.put, key, result)
+                try:
+                    os.unlink(job["path"])
+                except OSError:
+                    pass
+        finally:
+            heartbeat.cancel()
+        if job.get("webhook_url"):
+            self._notify(job["id"])
+
+
+async def _main(cfg: dict):
+    from service.workers import pool_from_config
+    from models.cache import cache_from_config
+    pool = pool_from_config(cfg)
+    pool.start()
+    if cfg.get("workers", {}).get("warmup", False):
+        await pool.prime()
+    worker = JobWorker(store_from_config(cfg), pool, cfg, cache=cache_from_config(cfg))
+    print(f"[JOBS] worker {worker.name}: {worker.concurrency} jobs a la vez")
+    try:
+        await worker.run()
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    import yaml
+    with open(os.environ.get("APP_CONFIG", "configs/app.yaml"), "r", encoding="utf-8") as f:
+        CONFIG = yaml.safe_load(f)
+    try:
+        asyncio.run(_main(CONFIG))
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,8 @@
-import os, time, yaml
-from fastapi import FastAPI
+import asyncio, os, time, yaml
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.openapi.utils import get_openapi
 
 APP_YAML = os.environ.get("APP_CONFIG", "configs/app.yaml")
@@ -8,7 +10,44 @@ APP_YAML = os.environ.get("APP_CONFIG", "configs/app.yaml")
 with open(APP_YAML, "r", encoding="utf-8") as f:
     CONFIG = yaml.safe_load(f)
 
-app = FastAPI(title=CONFIG["service"]["name"], version=CONFIG["service"]["version"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    os.makedirs(CONFIG["paths"]["workdir"], exist_ok=True)
+    from models import loader
+    loader.configure(CONFIG.get("models", {}))
+    from service.workers import pool_from_config
+    from models.cache import cache_from_config
+    pool = pool_from_config(CONFIG)
+    pool.start()
+    if CONFIG.get("workers", {}).get("warmup", False):
+        # los workers arrancan (y priman modelo + OCR) antes de aceptar pedidos
+        await pool.prime()
+    app.state.analysis_pool = pool
+    # compartido entre todos los batch en curso (ver AnalysisPool.background_share)
+    app.state.batch_slots = asyncio.Semaphore(pool.background_share)
+    app.state.result_cache = cache_from_config(CONFIG)
+    from service.fetch import fetcher_from_config
+    app.state.url_fetcher = fetcher_from_config(CONFIG)
+
+    from service.jobs import store_from_config, JobWorker
+    jcfg = CONFIG.get("jobs", {})
+    app.state.job_store = store_from_config(CONFIG)
+    worker = None
+    if jcfg.get("embedded_worker", True):
+        # los jobs comparten el pool con /risk-ml; con embedded_worker: false
+        # corren en procesos aparte (python -m service.jobs)
+        worker = JobWorker(app.state.job_store, pool, CONFIG, cache=app.state.result_cache, shared_pool=True)
+        worker.start()
+    try:
+        yield
+    finally:
+        if worker is not None:
+            await worker.stop()
+        app.state.url_fetcher.close()
+        pool.shutdown()
+
+app = FastAPI(title=CONFIG["service"]["name"], version=CONFIG["service"]["version"], lifespan=lifespan)
+app.state.config = CONFIG
 
 def custom_openapi():
     if app.openapi_schema:
@@ -34,12 +73,83 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+# margen para los headers/boundaries del multipart sobre el tamaño del archivo
+_MULTIPART_OVERHEAD = 64 * 1024
+
+class LimitBodySize:
+    """
+    Corta el body en el máximo + _MULTIPART_OVERHEAD antes de que Starlette lo
+    parsee/spoolee: por Content-Length sin leer nada y, si no viene (chunked),
+    contando los bytes a medida que llegan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limits = CONFIG.get("limits", {})
+        if scope["path"].endswith("/batch"):
+            max_body = int(limits.get("max_batch_bytes") or 0)
+        else:
+            max_body = int(limits.get("max_bytes") or 0)
+        if not max_body:
+            return await self.app(scope, receive, send)
+        detail = f"El archivo supera el máximo de {max_body} bytes"
+        limit = max_body + _MULTIPART_OVERHEAD
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            return await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI deja pasar las HTTPException del parseo del body (el resto las vuelve 400)
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(LimitBodySize)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    from service import metrics
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # el template de la ruta (/jobs/{job_id}) y no el path, para acotar las series
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        if path != "/metrics":
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - t0, route=path, status=status)
+
 def get_config():
     return CONFIG
 
 @app.get("/health", include_in_schema=False)
 def health():
-    return {"status": "ok", "version": CONFIG["service"]["version"], "time": int(time.time())}
+    from models.loader import get_versions
+    from pipeline import ocr
+    return {"status": "ok", "version": CONFIG["service"]["version"], "time": int(time.time()),
+            "model": get_versions(), "ocr_backend": ocr.backend()}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    from service import metrics
+    text = metrics.render(pool=getattr(app.state, "analysis_pool", None),
+                          job_store=getattr(app.state, "job_store", None))
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
 
 
 from service.routes import router as ai_router
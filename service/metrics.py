@@ -0,0 +1,128 @@
+"""
+Métricas del servicio en formato de texto de Prometheus (GET /metrics).
+
+Histogramas y contadores se acumulan en memoria del proceso de la API; los
+gauges (pool, jobs) se leen en el momento del scrape.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PREFIX = "autenticaria"
+
+# en segundos: de un HTML chico a un PDF largo escaneado
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 2e6, 5e6, 10e6, 15e6, 50e6)
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    esc = lambda s: str(s).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = f"{PREFIX}_{name}", help, labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_labels(self.labelnames, key)} {_fmt(v)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...], labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = f"{PREFIX}_{name}", help, labelnames
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # por combinación de labels: [conteos por bucket (no acumulados), suma, total]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        idx = next(i for i, b in enumerate(self.buckets) if value <= b)
+        with self._lock:
+            st = self._values.get(key)
+            if st is None:
+                st = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            st[0][idx] += 1
+            st[1] += value
+            st[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._values.items()):
+                acc = 0
+                for b, c in zip(self.buckets, counts):
+                    acc += c
+                    out.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _fmt(b)))} {acc}")
+                out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(round(total, 6))}")
+                out.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return out
+
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Latencia de los pedidos HTTP",
+                         LATENCY_BUCKETS, ("route", "status"))
+STAGE_LATENCY = Histogram("stage_duration_seconds", "Tiempo por etapa del análisis (debug.timings)",
+                          LATENCY_BUCKETS, ("stage",))
+DOC_PAGES = Histogram("document_pages", "Páginas por documento analizado", PAGE_BUCKETS)
+DOC_BYTES = Histogram("document_bytes", "Tamaño en bytes de los documentos analizados", BYTE_BUCKETS)
+DOCS = Counter("documents_total", "Documentos procesados por resultado", ("outcome",))
+CACHE = Counter("cache_lookups_total", "Búsquedas en la cache de resultados", ("result",))
+PAGE_CACHE = Counter("ocr_page_cache_lookups_total", "Búsquedas en la cache de OCR por página", ("result",))
+
+_ALL = [HTTP_LATENCY, STAGE_LATENCY, DOC_PAGES, DOC_BYTES, DOCS, CACHE, PAGE_CACHE]
+
+
+def observe_result(result: dict, size_bytes: Optional[int] = None):
+    """Registra tiempos por etapa, páginas y tamaño de un análisis terminado."""
+    dbg = result.get("debug", {})
+    for stage, ms in (dbg.get("timings") or {}).items():
+        STAGE_LATENCY.observe(ms / 1000.0, stage=stage)
+    pages = (dbg.get("ocr_stats") or {}).get("pages")
+    if pages is not None:
+        DOC_PAGES.observe(pages)
+    for st in (dbg.get("ocr_stats") or {}).get("per_page") or []:
+        if "cached" in st:
+            PAGE_CACHE.inc(result="hit" if st["cached"] else "miss")
+    if size_bytes is not None:
+        DOC_BYTES.observe(size_bytes)
+    DOCS.inc(outcome="ok")
+
+
+def _gauge(name: str, help: str, samples: List[Tuple[str, float]]) -> List[str]:
+    name = f"{PREFIX}_{name}"
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge"] + [f"{name}{lbl} {_fmt(v)}" for lbl, v in samples]
+
+
+def render(pool=None, job_store=None) -> str:
+    lines: List[str] = []
+    for m in _ALL:
+        lines += m.render()
+    if pool is not None:
+        lines += _gauge("pool_processes", "Procesos del pool de análisis", [("", pool.processes)])
+        lines += _gauge("pool_capacity", "Trabajos admitidos a la vez (procesos + cola)", [("", pool.capacity)])
+        lines += _gauge("pool_in_flight", "Trabajos en el pool (corriendo + en cola)", [("", pool.in_flight)])
+        lines += _gauge("pool_queued", "Trabajos esperando un proceso libre", [("", pool.queued)])
+    if job_store is not None:
+        counts = job_store.counts()
+        lines += _gauge("jobs", "Jobs por estado", [(_labels(("status",), (s,)), n) for s, n in sorted(counts.items())])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,26 @@
+"""
+Módulo para precargar en el proceso del que se forkean los workers del pool
+(forkserver: multiprocessing.set_forkserver_preload; fork: el proceso padre).
+
+Importarlo deja cargados los módulos pesados del análisis y el modelo, así
+cada worker nace con todo en memoria compartida copy-on-write en lugar de
+importar y cargar su propia copia. No crea threads ni subprocesos (motor OCR,
+exiftool): no sobreviven a un fork y se crean en cada worker (warmup).
+"""
+import numpy  # noqa: F401
+import PIL.Image  # noqa: F401
+
+from models import infer_ml, loader  # noqa: F401
+from pipeline import ocr
+
+try:
+    import cv2  # noqa: F401
+except ImportError:
+    pass
+try:
+    import pypdf  # noqa: F401
+except ImportError:
+    pass
+
+ocr._tesserocr()
+loader.get_bundle()
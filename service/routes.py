@@ -1,27 +1,300 @@
-import os, tempfile, shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from models.infer_ml import analyze_document_ml
-from pathlib import Path
+import asyncio, hashlib, json, os, tempfile, time, zipfile
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from models.infer_ml import analyze_document_ml, extract_document_features, score_rows, build_result
+from models.cache import cache_key
+from models.loader import get_versions, get_bundle
+from service.workers import PoolBusy
+from service.uploads import ingest_upload, sniff_magic, IngestedUpload, UploadRejected, CHUNK_SIZE
+from service.jobs import job_files_dir, public_job, send_webhook
+from service.fetch import check_url
+from service import metrics
 
 router = APIRouter()
 
+def _busy(retry_after_s: int) -> HTTPException:
+    return HTTPException(status_code=503, detail="Servicio saturado, reintentar más tarde",
+                         headers={"Retry-After": str(retry_after_s)})
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
 @router.post("/risk-ml")
-async def risk_ml(file: UploadFile = File(...), language: str = "spa"):
-    suffix = Path(file.filename).suffix
-    if not suffix and file.content_type == "application/pdf":
-        suffix = ".pdf"
+async def risk_ml(request: Request, file: UploadFile = File(...), language: str = "spa", debug: bool = False):
+    cfg = request.app.state.config
+    try:
+        upload = await ingest_upload(file, cfg.get("limits", {}), cfg["paths"]["workdir"])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return await _analyze_upload(request, upload, language, debug)
 
+
+class URLRequest(BaseModel):
+    url: str
+    language: str = "spa"
+    debug: bool = False
+
+@router.post("/risk-ml/url")
+async def risk_ml_url(request: Request, body: URLRequest):
+    """
+    Analiza un documento que ya está en otro lado (p.ej. una URL firmada de object
+    storage) sin re-subirlo: se descarga en streaming con el tope de max_bytes y
+    el hash calculado en vuelo, así un documento ya visto sale de la cache.
+    """
+    cfg = request.app.state.config
+    fetcher = request.app.state.url_fetcher
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo guardar el archivo: {e}")
+        upload = await run_in_threadpool(fetcher.fetch, body.url, cfg.get("limits", {}), cfg["paths"]["workdir"])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return await _analyze_upload(request, upload, body.language, body.debug)
 
+async def _analyze_upload(request: Request, upload: IngestedUpload, language: str, debug: bool):
+    """Cache por contenido y, si no está, análisis en el pool. Cierra el upload."""
+    workdir = request.app.state.config["paths"]["workdir"]
+    pool = request.app.state.analysis_pool
+    tmp_path = None
     try:
-        result = analyze_document_ml(tmp_path, language=language)
+        # con debug=true la respuesta incluye el texto OCR: no se cachea
+        cache = None if debug else request.app.state.result_cache
+        key = versions = None
+        if cache is not None:
+            versions = await run_in_threadpool(get_versions)
+            key = cache_key(upload.sha256, language, versions)
+            cached, tier = await run_in_threadpool(cache.get, key)
+            metrics.CACHE.inc(result=tier or "miss")
+            if cached is not None:
+                cached.setdefault("debug", {})["cache"] = {"hit": True, "tier": tier}
+                return cached
+
+        tmp_path = await run_in_threadpool(upload.materialize, workdir)
+        try:
+            result = await pool.run(analyze_document_ml, tmp_path, language, debug)
+        except PoolBusy:
+            raise
+        except Exception:
+            metrics.DOCS.inc(outcome="error")
+            raise
+        metrics.observe_result(result, upload.size)
+        # si el worker ya tomó otro release, el resultado no corresponde a esta clave
+        if cache is not None and result["debug"].get("model_version") == versions["model_version"]:
+            await run_in_threadpool(cache.put, key, result)
+            result.setdefault("debug", {})["cache"] = {"hit": False}
         return result
+    except PoolBusy as e:
+        raise _busy(e.retry_after_s)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en análisis ML: {e}")
     finally:
-        os.unlink(tmp_path)
\ No newline at end of file
+        upload.close()
+        if tmp_path:
+            _unlink(tmp_path)
+
+def _unpack_zip(zip_path: str, prefix: str, limits: dict, workdir: str, max_files: int) -> List[dict]:
+    """
+    Extrae los documentos de un zip a workdir, con las mismas validaciones que un
+    upload suelto (magic bytes, max_bytes) y hasheando mientras copia.
+    """
+    allowed = set(limits.get("allowed_ext", []))
+    max_bytes = int(limits.get("max_bytes") or 0)
+    out = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            if len(out) >= max_files:
+                break
+            name = f"{prefix}/{info.filename}"
+            too_big = f"El archivo supera el máximo de {max_bytes} bytes"
+            if max_bytes and info.file_size > max_bytes:
+                out.append({"name": name, "error": too_big})
+                continue
+            with zf.open(info) as src:
+                head = src.read(CHUNK_SIZE)
+                ext = sniff_magic(head)
+                if ext is None or ext not in allowed:
+                    out.append({"name": name, "error": "Tipo de archivo no soportado"})
+                    continue
+                h, size = hashlib.sha256(), 0
+                fd, path = tempfile.mkstemp(dir=workdir, suffix=ext)
+                with os.fdopen(fd, "wb") as dst:
+                    chunk = head
+                    while chunk:
+                        size += len(chunk)
+                        if max_bytes and size > max_bytes:
+                            break
+                        h.update(chunk)
+                        dst.write(chunk)
+                        chunk = src.read(CHUNK_SIZE)
+                if max_bytes and size > max_bytes:
+                    # el header del zip puede mentir sobre el tamaño descomprimido
+                    _unlink(path)
+                    out.append({"name": name, "error": too_big})
+                    continue
+                out.append({"name": name, "path": path, "sha256": h.hexdigest(), "size": size})
+    return out
+
+async def _collect_batch(files: List[UploadFile], limits: dict, workdir: str) -> List[dict]:
+    """Valida y guarda cada archivo del batch: [{"name", "path", "sha256"} | {"name", "error"}]."""
+    allowed_ext = list(limits.get("allowed_ext", [])) + [".zip"]
+    max_files = int(limits.get("max_batch_files", 500))
+    docs = []
+    for f in files:
+        if len(docs) >= max_files:
+            break
+        try:
+            upload = await ingest_upload(f, limits, workdir, allowed_ext=allowed_ext)
+        except UploadRejected as e:
+            docs.append({"name": f.filename, "error": e.detail})
+            continue
+        try:
+            path = await run_in_threadpool(upload.materialize, workdir)
+        finally:
+            upload.close()
+        if upload.ext == ".zip":
+            try:
+                docs.extend(await run_in_threadpool(_unpack_zip, path, f.filename, limits, workdir, max_files - len(docs)))
+            except zipfile.BadZipFile:
+                docs.append({"name": f.filename, "error": "Zip inválido"})
+            finally:
+                _unlink(path)
+        else:
+            docs.append({"name": f.filename, "path": path, "sha256": upload.sha256, "size": upload.size})
+    return docs
+
+@router.post("/risk-ml/batch")
+async def risk_ml_batch(request: Request, files: List[UploadFile] = File(...), language: str = "spa"):
+    """
+    Analiza muchos documentos (varios archivos o un .zip) y devuelve NDJSON: una
+    línea por documento a medida que terminan. La extracción corre en el pool de
+    procesos; las filas que terminan juntas se puntúan con un único predict.
+    """
+    cfg = request.app.state.config
+    pool = request.app.state.analysis_pool
+    cache = request.app.state.result_cache
+    docs = await _collect_batch(files, cfg.get("limits", {}), cfg["paths"]["workdir"])
+
+    def line(idx: int, payload: dict) -> str:
+        return json.dumps({"index": idx, "filename": docs[idx]["name"], **payload}, ensure_ascii=False) + "\n"
+
+    async def stream():
+        # todos los batch juntos usan como máximo pool.background_share lugares; con
+        # los del worker de jobs embebido queda cola para los pedidos de /risk-ml
+        slots = request.app.state.batch_slots
+        versions = await run_in_threadpool(get_versions)
+
+        async def extract(idx: int, path: str):
+            async with slots:
+                try:
+                    return idx, await pool.run(extract_document_features, path, language, wait=True), None
+                except Exception as e:
+                    return idx, None, f"Error en análisis ML: {e}"
+
+        pending, keys = set(), {}
+        try:
+            for idx, doc in enumerate(docs):
+                if "error" in doc:
+                    yield line(idx, {"error": doc["error"]})
+                    continue
+                if cache is not None:
+                    keys[idx] = cache_key(doc["sha256"], language, versions)
+                    cached, tier = await run_in_threadpool(cache.get, keys[idx])
+                    metrics.CACHE.inc(result=tier or "miss")
+                    if cached is not None:
+                        cached.setdefault("debug", {})["cache"] = {"hit": True, "tier": tier}
+                        yield line(idx, cached)
+                        continue
+                pending.add(asyncio.ensure_future(extract(idx, doc["path"])))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished = sorted(task.result() for task in done)
+                ok = [(idx, ext) for idx, ext, err in finished if err is None]
+                for idx, _, err in finished:
+                    if err is not None:
+                        metrics.DOCS.inc(outcome="error")
+                        yield line(idx, {"error": err})
+                t0 = time.perf_counter()
+                bundle = await run_in_threadpool(get_bundle)
+                scores = await run_in_threadpool(score_rows, [ext["row"] for _, ext in ok], bundle)
+                # un predict para todo el grupo: cada documento reporta el tiempo del grupo
+                predict_ms = round((time.perf_counter() - t0) * 1000, 1)
+                for (idx, ext), y01 in zip(ok, scores):
+                    ext["debug"]["timings"]["predict"] = predict_ms
+                    result = build_result(ext, y01, bundle)
+                    metrics.observe_result(result, docs[idx].get("size"))
+                    if cache is not None and bundle.version == versions["model_version"]:
+                        await run_in_threadpool(cache.put, keys[idx], result)
+                        result["debug"]["cache"] = {"hit": False}
+                    yield line(idx, result)
+        finally:
+            for task in pending:
+                task.cancel()
+            for doc in docs:
+                if "path" in doc:
+                    _unlink(doc["path"])
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.post("/jobs", status_code=202)
+async def create_job(request: Request, background: BackgroundTasks, file: UploadFile = File(...),
+                     language: str = "spa", webhook_url: Optional[str] = None):
+    """
+    Encola el análisis y responde enseguida con el id del job. El resultado se
+    consulta en GET /jobs/{id} o llega por POST a webhook_url al terminar.
+    """
+    cfg = request.app.state.config
+    store = request.app.state.job_store
+    cache = request.app.state.result_cache
+    allow_private = bool(cfg.get("jobs", {}).get("webhook_allow_private", False))
+    if webhook_url:
+        # el webhook recibe el resultado completo: no puede apuntar a la red interna
+        try:
+            await run_in_threadpool(check_url, webhook_url, (), allow_private)
+        except UploadRejected as e:
+            raise HTTPException(status_code=400, detail=f"webhook_url inválido: {e.detail}")
+
+    try:
+        upload = await ingest_upload(file, cfg.get("limits", {}), cfg["paths"]["workdir"])
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    try:
+        cached = None
+        if cache is not None:
+            versions = await run_in_threadpool(get_versions)
+            cached, tier = await run_in_threadpool(cache.get, cache_key(upload.sha256, language, versions))
+            metrics.CACHE.inc(result=tier or "miss")
+        if cached is not None:
+            cached.setdefault("debug", {})["cache"] = {"hit": True, "tier": tier}
+            job_id = await run_in_threadpool(store.create, upload.filename, None, upload.sha256,
+                                             language, webhook_url, cached)
+            if webhook_url:
+                background.add_task(send_webhook, store, job_id, allow_private=allow_private)
+        else:
+            path = await run_in_threadpool(upload.materialize, job_files_dir(cfg))
+            try:
+                job_id = await run_in_threadpool(store.create, upload.filename, path, upload.sha256,
+                                                 language, webhook_url)
+            except Exception:
+                _unlink(path)
+                raise
+    finally:
+        upload.close()
+
+    job = await run_in_threadpool(store.get, job_id)
+    return {"job_id": job_id, "status": job["status"], "status_url": f"/jobs/{job_id}"}
+
+@router.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    job = await run_in_threadpool(request.app.state.job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inexistente")
+    return public_job(job)
@@ -0,0 +1,104 @@
+import hashlib, os, tempfile
+from typing import List, Optional
+from fastapi import UploadFile
+
+CHUNK_SIZE = 64 * 1024
+
+# extensiones equivalentes: se comparan por "familia"
+_FAMILY = {".jpeg": ".jpg", ".tiff": ".tif", ".htm": ".html"}
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _family(ext: str) -> str:
+    ext = (ext or "").lower()
+    return _FAMILY.get(ext, ext)
+
+
+def sniff_magic(head: bytes) -> Optional[str]:
+    """Tipo real del archivo según sus primeros bytes; None si no es un formato soportado."""
+    if head.startswith(b"%PDF-"):
+        return ".pdf"
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return ".tif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head.startswith(b"PK\x03\x04"):
+        return ".zip"
+    text = head[:2048].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(b"<") and (b"<html" in text or b"<!doctype html" in text or b"<body" in text):
+        return ".html"
+    return None
+
+
+class IngestedUpload:
+    """
+    Archivo recibido y validado: hash, tamaño y tipo real. El contenido queda en
+    memoria si es chico o en paths.workdir si supera el umbral de spool.
+    """
+
+    def __init__(self, filename: str, ext: str, sha256: str, size: int, spool):
+        self.filename = filename
+        self.ext = ext
+        self.sha256 = sha256
+        self.size = size
+        self._spool = spool
+
+    def materialize(self, workdir: str) -> str:
+        """Escribe el contenido a un archivo en workdir (lo necesitan pdftoppm/exiftool)."""
+        self._spool.seek(0)
+        fd, path = tempfile.mkstemp(dir=workdir, prefix=self.sha256[:16] + "_", suffix=self.ext)
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = self._spool.read(1024 * 1024)
+                if not chunk:
+                    break
+                out.write(chunk)
+        return path
+
+    def close(self):
+        self._spool.close()
+
+
+async def ingest_upload(upload: UploadFile, limits: dict, workdir: str,
+                        allowed_ext: Optional[List[str]] = None) -> IngestedUpload:
+    """
+    Lee el upload por partes: valida el tipo por magic bytes en el primer chunk,
+    hashea mientras lee y corta apenas se supera limits.max_bytes.
+    """
+    max_bytes = int(limits.get("max_bytes") or 0)
+    allowed = {_family(e) for e in (allowed_ext if allowed_ext is not None else limits.get("allowed_ext", []))}
+    spool_max = int(limits.get("spool_max_bytes", 2 * 1024 * 1024))
+
+    first = await upload.read(CHUNK_SIZE)
+    if not first:
+        raise UploadRejected(400, "Archivo vacío")
+    ext = sniff_magic(first)
+    if ext is None or (allowed and ext not in allowed):
+        raise UploadRejected(415, "Tipo de archivo no soportado")
+
+    h = hashlib.sha256()
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_max, dir=workdir)
+    try:
+        chunk = first
+        while chunk:
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadRejected(413, f"El archivo supera el máximo de {max_bytes} bytes")
+            h.update(chunk)
+            spool.write(chunk)
+            chunk = await upload.read(CHUNK_SIZE)
+    except BaseException:
+        spool.close()
+        raise
+    return IngestedUpload(upload.filename or f"upload{ext}", ext, h.hexdigest(), size, spool)
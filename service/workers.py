@@ -0,0 +1,153 @@
+import asyncio, importlib, multiprocessing, os, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional
+
+
+def _call(fn: Callable, *args) -> Any:
+    # Algunas excepciones de libs (p.ej. pytesseract) no se pueden des-serializar
+    # en el proceso padre y dejan el pool roto; viajan como RuntimeError.
+    try:
+        return fn(*args)
+    except Exception as e:
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+def _pid_after(delay_s: float) -> int:
+    time.sleep(delay_s)
+    return os.getpid()
+
+
+class PoolBusy(Exception):
+    """La cola de análisis está llena; el cliente debe reintentar más tarde."""
+
+    def __init__(self, retry_after_s: int):
+        super().__init__("Cola de análisis llena")
+        self.retry_after_s = retry_after_s
+
+
+class AnalysisPool:
+    """
+    Pool de procesos acotado para correr el análisis fuera del event loop.
+    Admite hasta `processes + queue_depth` trabajos a la vez; el resto se rechaza
+    (PoolBusy) en lugar de acumularse en memoria.
+
+    Con start_method="forkserver" los procesos salen de un fork de un servidor
+    que ya importó los módulos de `preload` (service.preload carga el modelo):
+    el modelo se carga una vez y los workers lo comparten copy-on-write. Con
+    "fork" los módulos se importan en este proceso antes de crear el pool.
+    """
+
+    def __init__(self, processes: int = 0, queue_depth: int = 0, retry_after_s: int = 5,
+                 initializer: Callable = None, initargs: tuple = (),
+                 start_method: Optional[str] = None, preload: Optional[List[str]] = None):
+        self.processes = processes if processes and processes > 0 else (os.cpu_count() or 1)
+        self.queue_depth = max(0, int(queue_depth or 0))
+        self.retry_after_s = int(retry_after_s or 1)
+        self.capacity = self.processes + self.queue_depth
+        self.initializer = initializer
+        self.initargs = initargs
+        if start_method and start_method not in multiprocessing.get_all_start_methods():
+            # p.ej. forkserver en Windows
+            start_method = None
+        self.start_method = start_method or multiprocessing.get_start_method()
+        self.preload = list(preload or [])
+        self.in_flight = 0
+        self._slots = None
+        self._executor = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        ctx = multiprocessing.get_context(self.start_method)
+        if self.start_method == "forkserver" and self.preload:
+            ctx.set_forkserver_preload(self.preload)
+        elif self.start_method == "fork":
+            # con fork los workers heredan lo que ya cargó este proceso
+            for name in self.preload:
+                importlib.import_module(name)
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=ctx,
+                                   initializer=self.initializer, initargs=self.initargs)
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.capacity)
+        self._executor = self._new_executor()
+
+    async def prime(self, timeout_s: float = 300) -> List[int]:
+        """
+        Levanta ya todos los procesos (el executor los crea recién al primer
+        pedido) y espera a que terminen su initializer. Devuelve sus pids.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout_s
+        pids = set()
+        # un worker ya listo puede tomar todas las tareas: se repite hasta ver a todos
+        while len(pids) < self.processes and loop.time() < deadline:
+            pids.update(await asyncio.gather(*[loop.run_in_executor(self._executor, _pid_after, 0.05)
+                                               for _ in range(self.processes)]))
+        return sorted(pids)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def full(self) -> bool:
+        return self._slots is not None and self._slots.locked()
+
+    @property
+    def background_share(self) -> int:
+        """
+        Lugares para cada consumidor en segundo plano que espera lugar (batch,
+        worker de jobs embebido): la mitad de los procesos, acotada para que
+        entre los dos dejen lugar en `capacity` a los pedidos interactivos.
+        """
+        return max(1, min(self.processes // 2, (self.capacity - 1) // 2))
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.processes)
+
+    async def run(self, fn: Callable, *args, wait: bool = False) -> Any:
+        """
+        Ejecuta fn(*args) en un proceso del pool. Con wait=False, si no hay lugar
+        en la cola levanta PoolBusy de inmediato; con wait=True espera un lugar.
+        """
+        if not wait and self.full:
+            raise PoolBusy(self.retry_after_s)
+        await self._slots.acquire()
+        self.in_flight += 1
+        executor = self._executor
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, _call, fn, *args)
+        except BrokenProcessPool:
+            # un worker murió (OOM, segfault de una lib nativa): se recrea el pool
+            # una sola vez para que los pedidos siguientes no fallen todos.
+            if self._executor is executor:
+                self.shutdown()
+                self._executor = self._new_executor()
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+
+def init_worker(cfg: dict):
+    """Initializer de cada proceso del pool: config y, si está activado, warmup."""
+    from models.infer_ml import configure, warmup
+    configure(cfg)
+    if cfg.get("workers", {}).get("warmup", False):
+        warmup()
+
+
+def pool_from_config(cfg: dict) -> AnalysisPool:
+    """AnalysisPool según la sección `workers`, con el config propagado a cada proceso."""
+    wcfg = cfg.get("workers", {})
+    return AnalysisPool(
+        processes=wcfg.get("processes", 0),
+        queue_depth=wcfg.get("queue_depth", 0),
+        retry_after_s=wcfg.get("retry_after_s", 5),
+        initializer=init_worker, initargs=(cfg,),
+        start_method=wcfg.get("start_method") or None,
+        preload=["service.preload"] if wcfg.get("preload_model", False) else None,
+    )
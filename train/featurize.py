@@ -0,0 +1,200 @@
+"""
+Featurizador offline: recorre una carpeta de documentos y arma filas de
+entrenamiento con el mismo código que usa el servicio (extract_document_features
+-> _build_feature_row), repartiendo los documentos en un pool de procesos.
+
+La salida son chunks columnares (part-00000.csv o .parquet) con doc_id, sha256,
+file_ext y las columnas de models/feature_spec.json en ese orden. Los chunks son
+el checkpoint: al relanzar se saltean los doc_id ya escritos, así una corrida
+interrumpida sigue donde quedó. Los documentos que fallan quedan en errors.jsonl.
+
+Uso:
+    python train/featurize.py --input /ruta/documentos --out data/features
+    python train/featurize.py --input ... --out ... --labels etiquetas.csv --format parquet
+    python train/train_model.py --data data/features
+"""
+import argparse, copy, json, os, pathlib, sys, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set
+import pandas as pd
+import yaml
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+MODELS = ROOT / "models"
+sys.path.insert(0, str(ROOT))
+
+from models.cache import file_sha256
+
+ID_COLS = ["doc_id", "sha256", "file_ext"]
+
+
+def iter_documents(input_dir: pathlib.Path, allowed_ext: List[str]) -> Iterator[pathlib.Path]:
+    allowed = {e.lower() for e in allowed_ext}
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if pathlib.Path(name).suffix.lower() in allowed:
+                yield pathlib.Path(dirpath) / name
+
+
+def _featurize_one(path: str, doc_id: str, language: str) -> Dict[str, Any]:
+    """Corre en el worker: una fila de features o el error."""
+    from models.infer_ml import extract_document_features
+    try:
+        sha = file_sha256(path)
+        ext = extract_document_features(path, language)
+        return {"doc_id": doc_id, "sha256": sha, "file_ext": pathlib.Path(path).suffix.lower(), **ext["row"]}
+    except Exception as e:
+        return {"doc_id": doc_id, "error": f"{type(e).__name__}: {e}"}
+
+
+class ChunkWriter:
+    """Escribe filas en chunks numerados; cada chunk se escribe completo o no se escribe."""
+
+    def __init__(self, out_dir: pathlib.Path, columns: List[str], fmt: str = "csv",
+                 chunk_rows: int = 1000, labels: Optional[pd.DataFrame] = None):
+        self.out_dir = out_dir
+        self.columns = columns
+        self.fmt = fmt
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.labels = labels
+        self.rows: List[Dict[str, Any]] = []
+        parts = sorted(out_dir.glob("part-*.*"))
+        self.next_part = max((int(p.stem.split("-")[1]) for p in parts), default=-1) + 1
+
+    def add(self, row: Dict[str, Any]):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        df = pd.DataFrame(self.rows).reindex(columns=self.columns).fillna(0)
+        if self.labels is not None:
+            df = df.merge(self.labels, on="doc_id", how="left")
+        path = self.out_dir / f"part-{self.next_part:05d}.{self.fmt}"
+        tmp = path.with_name(path.name + ".tmp")
+        if self.fmt == "parquet":
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+        self.next_part += 1
+        self.rows = []
+
+
+def done_doc_ids(out_dir: pathlib.Path) -> Set[str]:
+    """doc_id ya escritos en chunks anteriores (el checkpoint)."""
+    done: Set[str] = set()
+    for p in out_dir.glob("part-*.csv"):
+        done.update(pd.read_csv(p, usecols=["doc_id"], dtype=str)["doc_id"])
+    for p in out_dir.glob("part-*.parquet"):
+        done.update(pd.read_parquet(p, columns=["doc_id"])["doc_id"].astype(str))
+    return done
+
+def failed_doc_ids(out_dir: pathlib.Path) -> Set[str]:
+    path = out_dir / "errors.jsonl"
+    if not path.exists():
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {json.loads(line)["doc_id"] for line in f if line.strip()}
+
+
+def featurize(input_dir: pathlib.Path, out_dir: pathlib.Path, cfg: Dict[str, Any], language: str,
+              workers: int, fmt: str = "csv", chunk_rows: int = 1000,
+              labels: Optional[pd.DataFrame] = None, retry_errors: bool = False) -> Dict[str, int]:
+    from models.infer_ml import configure
+    from tqdm import tqdm
+
+    spec = json.loads((MODELS / "feature_spec.json").read_text(encoding="utf-8"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    skip = done_doc_ids(out_dir)
+    if not retry_errors:
+        skip |= failed_doc_ids(out_dir)
+
+    docs = [p for p in iter_documents(input_dir, cfg.get("limits", {}).get("allowed_ext", []))]
+    todo = [(str(p), p.relative_to(input_dir).as_posix()) for p in docs]
+    todo = [(path, doc_id) for path, doc_id in todo if doc_id not in skip]
+    print(f"[FEATURIZE] {len(docs)} documentos, {len(docs) - len(todo)} ya procesados, {len(todo)} pendientes")
+
+    # los threads de OCR por proceso se reparten según la cantidad de workers
+    cfg = copy.deepcopy(cfg)
+    cfg.setdefault("workers", {})["processes"] = workers
+
+    writer = ChunkWriter(out_dir, ID_COLS + spec["features"], fmt, chunk_rows, labels)
+    counts = {"ok": 0, "error": 0}
+    pending, it = set(), iter(todo)
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure, initargs=(cfg,)) as ex, \
+            open(out_dir / "errors.jsonl", "a", encoding="utf-8") as errors, \
+            tqdm(total=len(todo), unit="doc") as bar:
+        try:
+            while True:
+                # como mucho 2 documentos por worker en vuelo: la lista de pendientes no crece
+                while len(pending) < 2 * workers:
+                    nxt = next(it, None)
+                    if nxt is None:
+                        break
+                    pending.add(ex.submit(_featurize_one, nxt[0], nxt[1], language))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    res = fut.result()
+                    if "error" in res:
+                        counts["error"] += 1
+                        errors.write(json.dumps({**res, "time": int(time.time())}, ensure_ascii=False) + "\n")
+                        errors.flush()
+                    else:
+                        counts["ok"] += 1
+                        writer.add(res)
+                    bar.update(1)
+        except KeyboardInterrupt:
+            for fut in pending:
+                fut.cancel()
+            print("\n[FEATURIZE] interrumpido: se guardan las filas terminadas")
+        finally:
+            writer.flush()
+    return counts
+
+
+def load_features(path: pathlib.Path) -> pd.DataFrame:
+    """Un CSV o una carpeta de chunks de featurize (CSV y/o Parquet) como un solo DataFrame."""
+    path = pathlib.Path(path)
+    if path.is_file():
+        return pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+    parts = [pd.read_csv(p) for p in sorted(path.glob("part-*.csv"))]
+    parts += [pd.read_parquet(p) for p in sorted(path.glob("part-*.parquet"))]
+    if not parts:
+        raise SystemExit(f"No hay chunks part-* en {path}")
+    return pd.concat(parts, ignore_index=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Extrae features de una carpeta de documentos")
+    ap.add_argument("--input", required=True, help="carpeta con documentos (se recorre recursivamente)")
+    ap.add_argument("--out", default=str(ROOT / "data" / "features"))
+    ap.add_argument("--config", default=os.environ.get("APP_CONFIG", str(ROOT / "configs" / "app.yaml")))
+    ap.add_argument("--language", default=None, help="por defecto ocr.default_lang")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    ap.add_argument("--chunk-rows", type=int, default=1000)
+    ap.add_argument("--labels", default=None,
+        help="CSV con doc_id y las columnas objetivo (p.ej. y_score_1_100, y_label) para unir a cada fila")
+    ap.add_argument("--retry-errors", action="store_true", help="reintentar los documentos de errors.jsonl")
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    labels = pd.read_csv(args.labels, dtype={"doc_id": str}) if args.labels else None
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("--format parquet requiere pyarrow (pip install pyarrow)")
+
+    t0 = time.time()
+    counts = featurize(pathlib.Path(args.input), pathlib.Path(args.out), cfg,
+                       args.language or cfg.get("ocr", {}).get("default_lang", "spa"),
+                       max(1, args.workers), args.format, args.chunk_rows, labels, args.retry_errors)
+    print(f"[FEATURIZE] ok={counts['ok']} errores={counts['error']} en {time.time() - t0:.1f}s -> {args.out}")
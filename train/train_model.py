@@ -1,7 +1,18 @@
-import json, pathlib, argparse
+"""
+Entrena el modelo de riesgo y lo guarda en models/ (rf_model.pkl, el bosque
+compilado y feature_spec.json), más models/model_card.json con las métricas y
+la latencia medida del modelo que se va a servir.
+
+Uso:
+    python train/train_model.py                          # bosque de 400 árboles
+    python train/train_model.py --sweep --latency-budget-ms 2
+    python train/train_model.py --sweep --publish        # además lo activa en el servicio sin reiniciar
+"""
+import io, json, pathlib, argparse, shutil, sys, time
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold, cross_validate, train_test_split
+from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor, RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, root_mean_squared_error, r2_score
 import joblib
 
@@ -9,17 +20,22 @@ ROOT = pathlib.Path(__file__).resolve().parents[1]
 DATA = ROOT / "data" / "dataset_autenticarIA200.csv"
 MODELS = ROOT / "models"
 MODELS.mkdir(exist_ok=True)
+sys.path.insert(0, str(ROOT))
 
 TARGET_COL = "y_score_1_100"   
 LABEL_COL  = "y_label"         
 
 DROP_EXPLICIT = {
-    "doc_id", "tipo_doc", "file_ext", "document_language",
+    "doc_id", "sha256", "tipo_doc", "file_ext", "document_language",
     "meta_producer", "meta_creator", "meta_createdate", "meta_modifydate",
     LABEL_COL, TARGET_COL
 }
 
 def load_dataset(path: pathlib.Path) -> pd.DataFrame:
+    if path.is_dir():
+        # carpeta de chunks generada por train/featurize.py
+        from train.featurize import load_features
+        return load_features(path)
     df = pd.read_csv(path)
     return df
 
@@ -44,15 +60,180 @@ def build_matrices(df: pd.DataFrame):
     }
     return X, y01, feature_spec
 
+# barrido: (estimador, grilla de hiperparámetros)
+ESTIMATORS = {
+    "rf": RandomForestRegressor,
+    "et": ExtraTreesRegressor,
+    "hgb": HistGradientBoostingRegressor,
+}
+SWEEP_GRID = [
+    ("rf", {"n_estimators": [50, 100, 200, 400], "max_depth": [None, 8, 12], "min_samples_leaf": [1, 3]}),
+    ("et", {"n_estimators": [100, 200], "max_depth": [None, 12], "min_samples_leaf": [1, 3]}),
+    ("hgb", {"max_iter": [100, 300], "max_depth": [None, 6], "min_samples_leaf": [5, 20]}),
+]
+BATCH_ROWS = 256
+
+
+def sweep_candidates():
+    from sklearn.model_selection import ParameterGrid
+    return [(kind, params) for kind, grid in SWEEP_GRID for params in ParameterGrid(grid)]
+
+def make_estimator(kind: str, params, n_jobs: int = 1):
+    extra = {"n_jobs": n_jobs} if kind in ("rf", "et") else {}
+    return ESTIMATORS[kind](random_state=42, **params, **extra)
+
+def serving_model(model):
+    """Lo que carga el servicio: el bosque compilado si es RF/ExtraTrees, si no el estimador."""
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        from models.forest import CompiledForest, compile_forest
+        return CompiledForest(compile_forest(model))
+    return model
+
+def serialized_size(model):
+    buf = io.BytesIO()
+    joblib.dump(model, buf)
+    sizes = {"pkl_bytes": buf.getbuffer().nbytes}
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        from models.forest import _ARRAYS, compile_forest
+        arrays = compile_forest(model)
+        sizes["forest_bytes"] = int(sum(arrays[k].nbytes for k in _ARRAYS))
+    return sizes
+
+def measure_latency(model, X: np.ndarray, repeat: int = 200):
+    """
+    Latencia de predict como la llama el servicio (array float64): una fila
+    (p50/p95) y un lote de BATCH_ROWS filas. Se mide en serie, sin otros
+    entrenamientos corriendo, para no contaminar los tiempos.
+    """
+    m = serving_model(model)
+    rng = np.random.default_rng(0)
+    batch = X[rng.integers(0, len(X), BATCH_ROWS)]
+    for i in range(5):
+        m.predict(X[i % len(X)][None, :])
+    single = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        m.predict(X[i % len(X)][None, :])
+        single.append((time.perf_counter() - t0) * 1000)
+    batched = []
+    for _ in range(max(3, repeat // 20)):
+        t0 = time.perf_counter()
+        m.predict(batch)
+        batched.append((time.perf_counter() - t0) * 1000)
+    batch_p50 = float(np.percentile(batched, 50))
+    return {
+        "single_p50_ms": round(float(np.percentile(single, 50)), 4),
+        "single_p95_ms": round(float(np.percentile(single, 95)), 4),
+        "batch_rows": BATCH_ROWS,
+        "batch_p50_ms": round(batch_p50, 4),
+        "per_row_us": round(batch_p50 * 1000 / BATCH_ROWS, 3),
+    }
+
+def _cv_one(kind: str, params, X, y, folds: int):
+    res = cross_validate(make_estimator(kind, params), X, y, cv=KFold(folds, shuffle=True, random_state=42),
+                         scoring=("neg_mean_absolute_error", "r2"))
+    return {
+        "cv_mae": round(float(-res["test_neg_mean_absolute_error"].mean()), 5),
+        "cv_mae_std": round(float(res["test_neg_mean_absolute_error"].std()), 5),
+        "cv_r2": round(float(np.nanmean(res["test_r2"])), 5),
+        "fit_s": round(float(res["fit_time"].mean()), 3),
+    }
+
+def run_sweep(X: pd.DataFrame, y: pd.Series, folds: int = 5, jobs: int = -1):
+    """
+    CV de todos los candidatos en paralelo (un candidato por proceso) y después,
+    en serie, ajuste sobre todos los datos + latencia y tamaño de cada uno.
+    """
+    from joblib import Parallel, delayed
+    cands = sweep_candidates()
+    folds = max(2, min(folds, len(X)))
+    print(f"[SWEEP] {len(cands)} candidatos, {folds}-fold CV")
+    cv = Parallel(n_jobs=jobs)(delayed(_cv_one)(kind, params, X, y, folds) for kind, params in cands)
+
+    Xn = X.to_numpy(dtype=np.float64)
+    results = []
+    for (kind, params), scores in zip(cands, cv):
+        model = make_estimator(kind, params).fit(X, y)
+        r = {"estimator": ESTIMATORS[kind].__name__, "params": params, **scores,
+             "latency": measure_latency(model, Xn), **serialized_size(model)}
+        results.append((r, model))
+        print(f"  {r['estimator']:<30} {json.dumps(params):<60} MAE={r['cv_mae']:.4f} R2={r['cv_r2']:.3f} "
+              f"1 fila={r['latency']['single_p50_ms']:.3f}ms lote={r['latency']['batch_p50_ms']:.2f}ms "
+              f"pkl={r['pkl_bytes']/1e6:.2f}MB")
+    return results
+
+def select_model(results, latency_budget_ms: float, mae_tolerance: float = 0.0):
+    """
+    Entre los que entran en el presupuesto de latencia (una fila, p50) toma el
+    menor MAE de CV; si otros quedan a menos de `mae_tolerance` de ese MAE se
+    prefiere el más rápido de ellos.
+    """
+    within = [(r, m) for r, m in results if r["latency"]["single_p50_ms"] <= latency_budget_ms]
+    if within:
+        best_mae = min(r["cv_mae"] for r, _ in within)
+        close = [(r, m) for r, m in within if r["cv_mae"] <= best_mae + mae_tolerance]
+        return min(close, key=lambda rm: rm[0]["latency"]["single_p50_ms"]), len(within)
+    print(f"[SWEEP] ningún candidato entra en {latency_budget_ms}ms: se elige el más rápido")
+    return min(results, key=lambda rm: rm[0]["latency"]["single_p50_ms"]), 0
+
+def save_model(model, feature_spec, card, publish: bool = False):
+    joblib.dump(model, MODELS / "rf_model.pkl")
+    with open(MODELS / "feature_spec.json", "w", encoding="utf-8") as f:
+        json.dump(feature_spec, f, ensure_ascii=False, indent=2)
+
+    # versión compilada para servir sin sklearn (ver models/forest.py)
+    from models.forest import compile_forest, save_forest, BUNDLE
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        save_forest(compile_forest(model), BUNDLE)
+        card["serving"] = "compiled_forest"
+    else:
+        # un bosque compilado viejo no corresponde a este modelo
+        shutil.rmtree(BUNDLE, ignore_errors=True)
+        card["serving"] = "sklearn"
+    with open(MODELS / "model_card.json", "w", encoding="utf-8") as f:
+        json.dump(card, f, ensure_ascii=False, indent=2)
+    print(f"Guardado modelo en {MODELS/'rf_model.pkl'} ({card['serving']}), spec en {MODELS/'feature_spec.json'} "
+          f"y card en {MODELS/'model_card.json'}")
+
+    if publish:
+        # modelo + spec como un release nuevo: el servicio lo toma sin reiniciar (models/loader.py)
+        from models.loader import publish_release
+        print(f"Publicado release {publish_release(MODELS)}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--data", default=str(DATA))
     parser.add_argument("--n_estimators", type=int, default=400)
     parser.add_argument("--max_depth", type=int, default=None)
+    parser.add_argument("--sweep", action="store_true",
+        help="barrido con CV (RF, ExtraTrees, HistGradientBoosting) y elección dentro del presupuesto de latencia")
+    parser.add_argument("--latency-budget-ms", type=float, default=2.0,
+        help="p50 máximo de predict para una fila, en ms (con --sweep)")
+    parser.add_argument("--mae-tolerance", type=float, default=0.001,
+        help="diferencia de MAE (objetivo 0-1) que se cambia por un modelo más rápido (con --sweep)")
+    parser.add_argument("--cv", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="procesos para la CV del barrido")
+    parser.add_argument("--publish", action="store_true",
+        help="publicar el modelo como release activo (models/releases + CURRENT)")
     args = parser.parse_args()
 
     df = load_dataset(pathlib.Path(args.data))
     X, y, feature_spec = build_matrices(df)
+    card = {"trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "data": str(args.data), "rows": int(len(X)),
+            "n_features": int(X.shape[1])}
+
+    if args.sweep:
+        results = run_sweep(X, y, args.cv, args.jobs)
+        (best, model), n_within = select_model(results, args.latency_budget_ms, args.mae_tolerance)
+        print(f"[SWEEP] elegido {best['estimator']} {json.dumps(best['params'])} "
+              f"(MAE={best['cv_mae']:.4f}, 1 fila={best['latency']['single_p50_ms']:.3f}ms)")
+        card.update(best)
+        card["selection"] = {"latency_budget_ms": args.latency_budget_ms, "mae_tolerance": args.mae_tolerance,
+                             "candidates": len(results),
+                             "within_budget": n_within, "cv_folds": max(2, min(args.cv, len(X)))}
+        card["sweep"] = [r for r, _ in results]
+        save_model(model, feature_spec, card, args.publish)
+        sys.exit(0)
 
     Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, random_state=42)
 
@@ -71,8 +252,8 @@ if __name__ == "__main__":
 
     print(f"MAE={mae:.4f} | RMSE={rmse:.4f} | R2={r2:.4f}")
 
-    joblib.dump(model, MODELS / "rf_model.pkl")
-    with open(MODELS / "feature_spec.json", "w", encoding="utf-8") as f:
-        json.dump(feature_spec, f, ensure_ascii=False, indent=2)
-
-    print(f"Guardado modelo en {MODELS/'rf_model.pkl'} y spec en {MODELS/'feature_spec.json'}")
+    card.update({"estimator": "RandomForestRegressor",
+                 "params": {"n_estimators": args.n_estimators, "max_depth": args.max_depth},
+                 "holdout": {"mae": round(mae, 5), "rmse": round(rmse, 5), "r2": round(r2, 5)},
+                 "latency": measure_latency(model, X.to_numpy(dtype=np.float64)), **serialized_size(model)})
+    save_model(model, feature_spec, card, args.publish)